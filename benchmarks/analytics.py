@@ -0,0 +1,111 @@
+"""
+Times the numpy analytics engine (`sheets.analytics`) against the ORM path for the same
+figures, the `AvgStat` rows, `Entry.eval_average_spent_time` and the weekly and monthly
+buckets, on a synthetic history, and checks that both paths agree.
+Run with `python -m benchmarks.analytics [--years 5 --tasks 300]`.
+"""
+import os
+import sys
+import time
+import argparse
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'efficiensee.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.db.models import Min, Max  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from sheets import rollup  # noqa: E402
+from sheets.analytics import Entries, PERIODS  # noqa: E402
+from sheets.models import Sheet, Task, Entry, WeeklyStat, MonthlyStat  # noqa: E402
+from benchmarks import synthetic  # noqa: E402
+
+GROUPS = ['productive', 'alternative']
+TOLERANCE = 1e-3  # seconds; the ORM rounds timedelta divisions to microseconds
+
+
+def orm(sheet: Sheet) -> dict:
+    bounds = Entry.objects.filter(task__sheet=sheet).aggregate(first=Min('date'), last=Max('date'))
+    rollup._fill_calendar([bounds['first'], bounds['last']])  # the buckets join the calendar
+    task_ids = list(Task.objects.filter(sheet=sheet).values_list('id', flat=True))
+    return {
+        'tasks': rollup._avg_rows(task_ids),
+        'spent_time': {(period, group): Entry.eval_average_spent_time(period, group == 'alternative', sheet)
+                       for period in PERIODS for group in GROUPS},
+        'week': rollup._bucket_rows(WeeklyStat, [sheet.pk]),
+        'month': rollup._bucket_rows(MonthlyStat, [sheet.pk]),
+    }
+
+
+def engine(sheet: Sheet) -> dict:
+    entries = Entries.load(sheet)
+    return {
+        'tasks': {(task_id, tipe): {'avg': avg} for task_id, averages in entries.task_averages().items()
+                  for tipe, avg in averages.items()},
+        'spent_time': {(period, group): entries.spent_time(period, group) for period in PERIODS for group in GROUPS},
+        'week': {(sheet.pk, *key): {'total': total, 'days': days}
+                 for key, (total, days) in entries.buckets('week').items()},
+        'month': {(sheet.pk, *key): {'total': total, 'days': days}
+                  for key, (total, days) in entries.buckets('month').items()},
+    }
+
+
+def differences(expected: dict, found: dict) -> list[str]:
+    def equal(a, b) -> bool:
+        if hasattr(a, 'total_seconds') and hasattr(b, 'total_seconds'):
+            return abs(a.total_seconds() - b.total_seconds()) <= TOLERANCE
+        return a == b
+
+    problems = list()
+    for figure in expected:
+        for key in expected[figure].keys() | found[figure].keys():
+            a, b = expected[figure].get(key), found[figure].get(key)
+            if isinstance(a, dict) and isinstance(b, dict):
+                same = all(equal(a[field], b[field]) for field in b)
+            else:
+                same = a is not None and b is not None and equal(a, b)
+            if not same:
+                problems.append(f'{figure}{key}: orm {a}, engine {b}')
+    return problems
+
+
+def timed(name: str, func, sheet: Sheet) -> tuple[dict, float]:
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        result = func(sheet)
+    seconds = time.perf_counter() - start
+    print(f'{name:<10}{seconds:>10.3f}s{len(queries):>8} queries')
+    return result, seconds
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.analytics')
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--tasks', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        start = time.perf_counter()
+        sheet = Sheet.objects.create(name='benchmark', backend='xlsx')
+        synthetic.generate(sheet, years=args.years, tasks=args.tasks, seed=args.seed)
+        print(f'{Entry.objects.count()} entries of {args.tasks} tasks generated in '
+              f'{time.perf_counter() - start:.1f}s')
+
+        expected, orm_seconds = timed('orm', orm, sheet)
+        found, engine_seconds = timed('engine', engine, sheet)
+        print(f'speedup {orm_seconds / engine_seconds:.1f}x')
+        problems = differences(expected, found)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    for problem in problems[:20]:
+        print(problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
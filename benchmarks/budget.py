@@ -0,0 +1,98 @@
+"""
+Holds each stage of a run to a query-count budget and to the tables its queries may scan in
+full, so that N+1 loops and queries the indexes do not serve are caught before deploy.
+Run with `python -m benchmarks.budget`; it exits non-zero when a budget is exceeded.
+
+The budgets hold for the DATASET below. Bulk writes go out in batches, so their queries grow
+slowly with the data, while a query per task or per entry overruns the budget many times over.
+SQLite splits batches further than PostgreSQL does, and the budgets leave room for that.
+Plans come from EXPLAIN on PostgreSQL, with sequential scans disabled so that only tables no
+index can serve show up as scanned, and from EXPLAIN QUERY PLAN on SQLite.
+"""
+import re
+import sys
+import tempfile
+
+from pathlib import Path
+from benchmarks.pipeline import prepare
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+class Budget:
+    def __init__(self, queries: int, scans: set[str] = frozenset()):
+        self.queries = queries
+        self.scans = scans  # tables the stage reads in full by design
+
+
+DATASET = {'years': 1, 'tasks': 60}
+# tables read in full on purpose: the task list is synced and walked as a whole, rebuilds
+# aggregate every entry, every entry is pending right after the history is generated, and
+# the calendar is joined to every entry being bucketed.
+BUDGETS = {
+    'setup': Budget(0),
+    'renew_tasks': Budget(3, {'sheets_task'}),
+    'rebuild_totals': Budget(12, {'sheets_task', 'sheets_entry'}),
+    'eval_all_progress': Budget(52, {'sheets_entry'}),
+    'rollup_rebuild': Budget(16, {'sheets_task', 'sheets_entry', 'sheets_calendarday', 'sheets_avgstat',
+                                  'sheets_weeklystat', 'sheets_monthlystat'}),
+    'create_entries': Budget(30, {'sheets_task'}),
+    'update_average_cells': Budget(2, {'sheets_task'}),
+    'eval_average_spent_time': Budget(14, {'sheets_weeklystat', 'sheets_monthlystat'}),
+    'orm_average_spent_time': Budget(14, {'sheets_task', 'sheets_calendarday'}),
+    'flush': Budget(0),
+}
+EXPLAINED = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+
+def scanned_tables(sql: str) -> set[str]:
+    tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            with transaction.atomic():
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            return set(re.findall(r'Seq Scan on (\w+)', plan)) & tables
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+        return set(re.findall(r'\bSCAN (\w+)', plan)) & tables
+
+
+def check(name: str, queries: list[dict]) -> list[str]:
+    budget = BUDGETS[name]
+    problems = list()
+    if len(queries) > budget.queries:
+        problems.append(f'{name}: {len(queries)} queries, the budget is {budget.queries}')
+    for query in queries:
+        if not EXPLAINED.match(query['sql']):
+            continue
+        unexpected = scanned_tables(query['sql']) - budget.scans
+        if unexpected:
+            problems.append(f'{name}: scans {", ".join(sorted(unexpected))} in {query["sql"][:200]}')
+    return problems
+
+
+def main() -> int:
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    problems = list()
+    try:
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            _, _, stages = prepare(Path(snapshot_dir), **DATASET)
+            for name, func in stages:
+                with CaptureQueriesContext(connection) as queries:
+                    func()
+                found = check(name, queries.captured_queries)
+                print(f'{name:<28}{len(queries):>6} / {BUDGETS[name].queries:<6}'
+                      f'{"ok" if not found else "over budget"}')
+                problems.extend(found)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+In-process sheet backend for benchmarks. It keeps the values in memory, counts every call,
+and can add latency to each call and answer some calls with a 429 quota error the way
+the Sheets API does.
+"""
+import time
+import random
+
+from collections import Counter
+from gspread.exceptions import APIError
+from sheets.client.backends import SheetBackend
+from sheets.client.snapshot import parse_address, parse_range
+
+
+class QuotaResponse:
+    status_code = 429
+    text = 'Quota exceeded'
+
+    def json(self) -> dict:
+        return {'error': {'code': 429, 'message': self.text, 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class FakeBackend(SheetBackend):
+    quota = True
+
+    def __init__(self, rows: list[list[str]], latency: float = 0.0, quota_error_rate: float = 0.0, seed: int = 0):
+        self.rows = [list(row) for row in rows]
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.version = 0
+
+    def _call(self, name: str):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.quota_error_rate and self.random.random() < self.quota_error_rate:
+            raise APIError(QuotaResponse())
+
+    @property
+    def api_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def open(self):
+        self._call('open')
+
+    @property
+    def revision(self) -> str:
+        return f'fake:{id(self)}:{self.version}'
+
+    def _values(self) -> list[list[str]]:
+        width = max(map(len, self.rows), default=0)
+        return [row + [str()] * (width - len(row)) for row in self.rows]
+
+    def get_all_values(self) -> list[list[str]]:
+        self._call('get_all_values')
+        return self._values()
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        self._call('batch_get')
+        values = self._values()
+        result = list()
+        for address in ranges:
+            row1, col1, row2, col2 = parse_range(address)
+            result.append([row[col1:col2 + 1] for row in values[row1:None if row2 is None else row2 + 1]])
+        return result
+
+    def batch_update(self, data: list[dict]):
+        self._call('batch_update')
+        for change in data:
+            row, col = parse_address(change['range'])
+            while len(self.rows) <= row:
+                self.rows.append(list())
+            if len(self.rows[row]) <= col:
+                self.rows[row].extend([str()] * (col + 1 - len(self.rows[row])))
+            self.rows[row][col] = change['values'][0][0]
+        self.version += 1
@@ -0,0 +1,53 @@
+"""
+Micro-benchmark of utils.jcalendar against the per-date helpers of utils.datetime.
+Run with `python -m benchmarks.jcalendar [days]`.
+"""
+import sys
+import calendar
+import timeit
+import numpy as np
+
+from datetime import date, timedelta
+from utils import jcalendar
+from utils.string import format_date
+from utils.datetime import jdatify, last_week_day
+
+
+def stepping_last_week_day(week_day, from_date):
+    """The day-by-day loop `last_week_day` used before it became constant-time."""
+    potential_day = from_date - timedelta(days=1)
+    while potential_day.weekday() != week_day:
+        potential_day -= timedelta(days=1)
+    return potential_day
+
+
+def bench(name: str, func, number: int = 5):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print(f'{name:<40}{seconds * 1000:>10.3f} ms')
+    return seconds
+
+
+def main(days: int = 5 * 365):
+    start = date(2020, 1, 1)
+    dates = [start + timedelta(days=idx) for idx in range(days)]
+    ords = jcalendar.ordinals(dates)
+    jcalendar.month_starts()  # build the table outside of the timings
+    print(f'{days} dates')
+
+    bench('jdatify + format_date keys', lambda: [format_date(jdatify(dt)) for dt in dates])
+    bench('jcalendar.to_jalali', lambda: jcalendar.to_jalali(ords))
+    bench('jcalendar.month_key', lambda: jcalendar.month_key(ords))
+    bench('jcalendar.ordinals (from dates)', lambda: jcalendar.ordinals(dates))
+
+    bench('stepping last_week_day', lambda: [stepping_last_week_day(calendar.SATURDAY, dt) for dt in dates])
+    bench('last_week_day', lambda: [last_week_day(calendar.SATURDAY, from_date=dt) for dt in dates])
+    bench('jcalendar.week_start', lambda: jcalendar.week_start(ords - 1))
+
+    y, m, d = jcalendar.to_jalali(ords)
+    assert np.array_equal(jcalendar.to_gregorian(y, m, d), ords)
+    assert [format_date(jdatify(dt)) for dt in dates[:400]] == \
+        [f'{a:04}/{b:02}/{c:02}' for a, b, c in zip(y[:400], m[:400], d[:400])]
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,156 @@
+"""
+Runs every stage of a nightly run against a synthetic history and an in-process fake sheet,
+recording the seconds, database queries and sheet API calls of each stage.
+Run with `python -m benchmarks.pipeline [--years 5 --tasks 300] [--save FILE | --compare FILE]`.
+
+The database is a throwaway test database made from the configured one, so the numbers are
+only comparable between runs on the same database engine.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from pathlib import Path
+from typing import Callable
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'efficiensee.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from sheets import rollup  # noqa: E402
+from sheets.models import Sheet, Task, Entry  # noqa: E402
+from sheets.client.script import ProdClient  # noqa: E402
+from benchmarks import synthetic  # noqa: E402
+from benchmarks.fake_sheet import FakeBackend  # noqa: E402
+
+# stages whose seconds or queries grow by more than the tolerance fail a comparison
+WATCHED = ['rebuild_totals', 'eval_all_progress', 'rollup_rebuild', 'create_entries', 'update_average_cells',
+           'eval_average_spent_time', 'orm_average_spent_time', 'flush']
+
+
+def measure(results: dict, name: str, backend: FakeBackend, func):
+    api_calls = backend.api_calls
+    start = time.perf_counter()
+    error = None
+    with CaptureQueriesContext(connection) as queries:
+        try:
+            func()
+        except Exception as e:  # a failing stage is recorded, the remaining ones still run
+            error = f'{type(e).__name__}: {e}'
+    result = {'seconds': round(time.perf_counter() - start, 4), 'queries': len(queries),
+              'api_calls': backend.api_calls - api_calls}
+    if error:
+        result['error'] = error
+    results[name] = result
+    print(f'{name:<28}{result["seconds"]:>10.3f}s{result["queries"]:>8} queries{result["api_calls"]:>6} calls'
+          + (f'  {error}' if error else ''))
+
+
+def orm_average_spent_time(sheet: Sheet):
+    for period in ('daily', 'weekly', 'monthly'):
+        for alternatives in (False, True):
+            Entry.eval_average_spent_time(period, alternatives, sheet)
+
+
+def prepare(snapshot_dir: Path, years: float, tasks: int, latency: float = 0.0, quota_error_rate: float = 0.0,
+            seed: int = 0) -> tuple[ProdClient, FakeBackend, list[tuple[str, Callable]]]:
+    """
+    Generates the history and returns a client on a fake sheet and the stages to run, in order.
+    The client keeps its snapshot in snapshot_dir, a temporary one, instead of the data directory.
+    """
+    start = time.perf_counter()
+    sheet = Sheet.objects.create(name='benchmark', backend='xlsx')
+    rows = synthetic.generate(sheet, years=years, tasks=tasks, seed=seed)
+    print(f'{Entry.objects.count()} entries of {Task.objects.count()} tasks generated in '
+          f'{time.perf_counter() - start:.1f}s')
+
+    backend = FakeBackend(rows, latency=latency, quota_error_rate=quota_error_rate, seed=seed)
+    client = ProdClient(backend, sheet, snapshot_dir)
+    return client, backend, [
+        ('setup', lambda: client.setup(cache=False)),
+        ('renew_tasks', client.renew_tasks),
+        ('rebuild_totals', Task.rebuild_totals),
+        ('eval_all_progress', Entry.eval_all_progress),
+        ('rollup_rebuild', rollup.rebuild),
+        ('create_entries', client.create_entries),
+        ('update_average_cells', client.update_average_cells),
+        ('eval_average_spent_time', client.eval_average_spent_time),
+        ('orm_average_spent_time', lambda: orm_average_spent_time(sheet)),
+        ('flush', client.flush),
+    ]
+
+
+def run(years: float, tasks: int, latency: float, quota_error_rate: float, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        client, backend, stages = prepare(Path(snapshot_dir), years, tasks, latency, quota_error_rate, seed)
+        results = dict()
+        for name, func in stages:
+            measure(results, name, backend, func)
+    print(client.backend.report())
+    return {
+        'params': {'years': years, 'tasks': tasks, 'latency': latency, 'quota_error_rate': quota_error_rate,
+                   'seed': seed, 'vendor': connection.vendor},
+        'stages': results,
+        'scheduler': client.backend.stats(),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """The regressions of `current` against `baseline`, as messages."""
+    if current['params'] != baseline['params']:
+        return [f'parameters differ from the baseline: {baseline["params"]}']
+    regressions = list()
+    for name in WATCHED:
+        now, before = current['stages'].get(name), baseline['stages'].get(name)
+        if now is None or before is None:
+            continue
+        if 'error' in now and 'error' not in before:
+            regressions.append(f'{name} failed: {now["error"]}')
+        for key in ('seconds', 'queries', 'api_calls'):
+            # a small floor keeps near-zero timings from failing on noise
+            floor = 0.05 if key == 'seconds' else 0
+            if now[key] > max(before[key] * (1 + tolerance), before[key] + floor):
+                regressions.append(f'{name} {key}: {before[key]} -> {now[key]}')
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.pipeline')
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--tasks', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each sheet API call.')
+    parser.add_argument('--quota-error-rate', type=float, default=0.0,
+                        help='share of sheet API calls answered with a 429.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results to this JSON baseline.')
+    parser.add_argument('--compare', help='compare the results with this JSON baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative growth before a stage counts as a regression.')
+    args = parser.parse_args(argv)
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = run(args.years, args.tasks, args.latency, args.quota_error_rate, args.seed)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for message in regressions:
+            print(f'regression: {message}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Reports the import time of a management command, `run` by default, out of
+`python -X importtime manage.py <command> --help`: the total, the cost of each top-level
+package and the slowest first-party modules. It fails when the total exceeds the budget or
+when a module that only some backends need is imported at startup.
+Run with `python -m benchmarks.startup [--budget 500] [--top 10] [--command run]`.
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+from pathlib import Path
+from collections import Counter
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+FIRST_PARTY = ('sheets', 'utils', 'efficiensee', 'benchmarks')
+LAZY = ('gspread', 'openpyxl', 'google_auth_oauthlib')  # imported by the backends that use them, on first use
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def importtime(command: str) -> list[tuple[str, int, int, int]]:
+    """(module, self µs, cumulative µs, depth) of every import of the command's startup."""
+    process = subprocess.run([sys.executable, '-X', 'importtime', 'manage.py', command, '--help'],
+                             cwd=BASE_DIR, env=os.environ, capture_output=True, text=True)
+    if process.returncode:
+        raise RuntimeError(process.stderr[-2000:])
+    imports = list()
+    for line in process.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            imports.append((match[4], int(match[1]), int(match[2]), len(match[3]) // 2))
+    return imports
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.startup')
+    parser.add_argument('--command', default='run')
+    parser.add_argument('--budget', type=float, default=500, help='milliseconds of imports allowed.')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3, help='runs to take the fastest of.')
+    args = parser.parse_args(argv)
+
+    runs = [importtime(args.command) for _ in range(args.repeat)]
+    imports = min(runs, key=lambda run: sum(cumulative for _, _, cumulative, depth in run if depth == 0))
+    total = sum(cumulative for _, _, cumulative, depth in imports if depth == 0) / 1000
+
+    packages = Counter()
+    for module, own, _, _ in imports:
+        packages[module.split('.')[0]] += own
+    print(f'{args.command}: {total:.1f} ms of imports, {len(imports)} modules')
+    for package, own in packages.most_common(args.top):
+        print(f'  {package:<32}{own / 1000:>10.1f} ms')
+    print('first-party modules, cumulative:')
+    first_party = sorted(((cumulative, module) for module, _, cumulative, _ in imports
+                          if module.split('.')[0] in FIRST_PARTY), reverse=True)
+    for cumulative, module in first_party[:args.top]:
+        print(f'  {module:<32}{cumulative / 1000:>10.1f} ms')
+
+    problems = list()
+    if total > args.budget:
+        problems.append(f'{total:.1f} ms of imports, the budget is {args.budget:.0f} ms')
+    eager = sorted({module.split('.')[0] for module, _, _, _ in imports} & set(LAZY))
+    if eager:
+        problems.append(f'imported at startup: {", ".join(eager)}')
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Synthetic histories for benchmarks: tasks laid out on a sheet the way the real one is, and
+years of daily entries for them.
+"""
+import random
+
+from django.utils import timezone
+from datetime import date, timedelta
+from sheets.models import Sheet, Task, Entry
+from utils.string import stringify_timedelta
+
+GENRES = ['study', 'code', 'read', 'sport', 'lang', 'etc']
+ANALYTICAL_ROWS = 8
+
+
+def sheet_rows(tasks: list[Task], today: dict[int, timedelta]) -> list[list[str]]:
+    """
+    The task rows in columns A, B and D, a blank row after each group and the analytical block,
+    as `get_all_values` would return them.
+    """
+    rows = [['task', 'baseline', '', 'today', '', 'yesterday']]
+    for task in sorted(tasks, key=lambda t: t.row):
+        while len(rows) < task.row - 1:
+            rows.append([str()])
+        duration = today.get(task.id)
+        rows.append([task.name, '01:00', '', stringify_timedelta(duration) if duration else ''])
+    rows.append([str()])
+    rows.extend([f'analytical {idx}', ''] for idx in range(ANALYTICAL_ROWS))
+    return rows
+
+
+def generate(sheet: Sheet, years: float = 1, tasks: int = 30, density: float = 0.7,
+             alternative_share: float = 0.2, seed: int = 0) -> list[list[str]]:
+    """
+    Creates `tasks` tasks of the sheet with entries on roughly `density` of the days of the past
+    `years`, ending yesterday, and returns the sheet rows holding durations for today.
+    """
+    rnd = random.Random(seed)
+    alternatives = max(1, round(tasks * alternative_share))
+    productives = tasks - alternatives
+
+    task_objects = list()
+    for idx in range(tasks):
+        group = 'productive' if idx < productives else 'alternative'
+        row = idx + 2 if group == 'productive' else idx + 3  # a blank row between the groups
+        genre = GENRES[idx % len(GENRES)]
+        task_objects.append(Task(sheet=sheet, name=f'{genre}: task {idx}', row=row, group=group, genre=genre))
+    Task.objects.bulk_create(task_objects)
+    task_objects = list(Task.objects.filter(sheet=sheet))
+
+    end_date: date = timezone.localdate() - timedelta(days=1)
+    days = int(years * 365)
+    means = {task.id: rnd.randint(10, 180) for task in task_objects}
+
+    def duration(task: Task) -> timedelta:
+        return timedelta(minutes=max(1, int(rnd.gauss(means[task.id], means[task.id] / 3))))
+
+    entries = list()
+    for idx in range(days):
+        entry_date = end_date - timedelta(days=days - 1 - idx)
+        for task in task_objects:
+            if rnd.random() < density:
+                entries.append(Entry(task=task, date=entry_date, duration=duration(task)))
+        if len(entries) >= 20000:
+            Entry.objects.bulk_create(entries, batch_size=5000)
+            entries = list()
+    Entry.objects.bulk_create(entries, batch_size=5000)
+
+    today = {task.id: duration(task) for task in task_objects if rnd.random() < density}
+    return sheet_rows(task_objects, today)
@@ -133,3 +133,16 @@ GECKO_DRIVER_LATEST_RELEASE_URL = \
     "https://api.github.com/repos/mozilla/geckodriver/releases/latest"
 ZENMATE_PATH = BASE_DIR / 'data/zenmate_free_vpn_best-8.2.3.xpi'
 SHEET_NAME="productivity management"  # you should set this based on your google sheet document.
+SHEET_BACKEND = 'google'  # 'google' or 'xlsx'
+SHEET_XLSX_PATH = BASE_DIR / 'data/productivity.xlsx'  # used by the xlsx backend
+SHEETS_READ_REQUESTS_PER_MINUTE = 60  # the Sheets API per-user quotas
+SHEETS_WRITE_REQUESTS_PER_MINUTE = 60
+SHEETS_MAX_RETRIES = 6  # retries of calls answered with a quota or server error
+DETECT_TASK_RENAMES = False  # take a new task on the row of a missing one of the same group and genre as it renamed
+SHEETS_WORKERS = 4  # sheets synced at the same time by `run --all`
+ENTRY_PARTITIONING = None  # None, 'year' or 'quarter': range partitions of the entries table on postgres
+ENTRY_PARTITIONS_AHEAD = 1  # partitions created ahead of the current one
+STATS_CACHE_TIMEOUT = 60 * 60  # seconds the stats API keeps a response; a write to the sheet supersedes it
+AVERAGE_WINDOWS = [7, 30, 90]  # trailing windows, in days, of the averages the stats API reports
+SHEET_AVERAGE_WINDOW = None  # days averaged into the task and daily average cells; None for the whole history
+PROGRESS_WINDOW = None  # days of the average an entry's progress is measured against; None for the whole history
@@ -0,0 +1,225 @@
+"""
+In-memory analytics over the entries of a sheet. `Entries.load` reads them once into
+parallel numpy arrays (task index, day ordinal, duration seconds, progress), and every
+statistic is then a vectorized pass over those arrays instead of a query per period,
+group or task. The averages match `AvgStat` and `Entry.eval_average_spent_time`;
+`python -m benchmarks.analytics` times both paths and compares their figures.
+
+From the shell:
+    >>> entries = Entries.load(Sheet.default())
+    >>> entries.averages('genre')['dev']['weekly']
+"""
+import numpy as np
+
+from datetime import date, timedelta
+from itertools import islice
+from django.utils import timezone
+from sheets.models import Sheet, Task, Entry
+from utils import jcalendar
+
+PERIODS = ['daily', 'weekly', 'monthly']
+KEY_SPAN = 10 ** 7  # above every day ordinal, so that `code * KEY_SPAN + day` is a unique key
+
+
+def seconds(value: float) -> timedelta | None:
+    return None if value is None or np.isnan(value) else timedelta(seconds=float(value))
+
+
+class Entries:
+    def __init__(self, tasks: list[Task], task: np.ndarray, day: np.ndarray, duration: np.ndarray,
+                 progress: np.ndarray):
+        self.tasks = tasks
+        self.task_ids = np.array([task.pk for task in tasks], dtype=np.int64)
+        self.task = task  # index into tasks
+        self.day = day  # gregorian day ordinal
+        self.duration = duration  # seconds, nan for entries without a duration
+        self.progress = progress  # percent, nan where it is not evaluated
+
+    def __len__(self):
+        return len(self.task)
+
+    @classmethod
+    def load(cls, sheet: Sheet = None, first: date = None, last: date = None, chunk_size: int = 5000) -> 'Entries':
+        """The entries of a sheet, or of every sheet for None, from first through last if given."""
+        tasks = Task.objects.order_by('pk')
+        query = Entry.objects.all()
+        if sheet is not None:
+            tasks, query = tasks.filter(sheet=sheet), query.filter(task__sheet=sheet)
+        if first is not None:
+            query = query.filter(date__gte=first)
+        if last is not None:
+            query = query.filter(date__lte=last)
+        tasks = list(tasks)
+        position = {task.pk: idx for idx, task in enumerate(tasks)}
+
+        columns = [list(), list(), list(), list()]
+        rows = query.values_list('task_id', 'date', 'duration', 'progress').iterator(chunk_size=chunk_size)
+        while chunk := list(islice(rows, chunk_size)):  # a chunk of tuples at a time, not the whole history
+            columns[0].append(np.fromiter((position[row[0]] for row in chunk), dtype=np.int32, count=len(chunk)))
+            columns[1].append(np.fromiter((row[1].toordinal() for row in chunk), dtype=np.int64, count=len(chunk)))
+            columns[2].append(np.fromiter((np.nan if row[2] is None else row[2].total_seconds() for row in chunk),
+                                          dtype=np.float64, count=len(chunk)))
+            columns[3].append(np.fromiter((np.nan if row[3] is None else float(row[3]) for row in chunk),
+                                          dtype=np.float64, count=len(chunk)))
+        dtypes = [np.int32, np.int64, np.float64, np.float64]
+        return cls(tasks, *(np.concatenate(column) if column else np.empty(0, dtype=dtype)
+                            for column, dtype in zip(columns, dtypes)))
+
+    def labels(self, by: str) -> tuple[list[str], np.ndarray]:
+        """The distinct values of a task field, such as group or genre, and the code of each entry's."""
+        values = [getattr(task, by) for task in self.tasks]
+        names = sorted(set(values))
+        codes = np.array([names.index(value) for value in values], dtype=np.int64)
+        return names, codes[self.task] if len(self.tasks) else np.empty(0, dtype=np.int64)
+
+    def task_averages(self) -> dict[int, dict[str, timedelta]]:
+        """
+        The `AvgStat` figures of each task with entries, by tipe: the total duration over the
+        entries, and over the weeks, months and years from its first entry through its last.
+        """
+        count = np.bincount(self.task, minlength=len(self.tasks))
+        total = np.bincount(self.task, weights=np.nan_to_num(self.duration), minlength=len(self.tasks))
+        first = np.full(len(self.tasks), np.iinfo(np.int64).max)
+        last = np.zeros(len(self.tasks), dtype=np.int64)
+        np.minimum.at(first, self.task, self.day)
+        np.maximum.at(last, self.task, self.day)
+
+        idx = np.flatnonzero(count)
+        first, last = first[idx], last[idx]
+        spans = {
+            '*': count[idx],
+            'w': (jcalendar.week_start(last) - jcalendar.week_start(first)) // 7 + 1,
+            'm': jcalendar.month_index(last) - jcalendar.month_index(first) + 1,
+            'y': jcalendar.to_jalali(last)[0] - jcalendar.to_jalali(first)[0] + 1,
+        }
+        averages = {tipe: (total[idx] / span).tolist() for tipe, span in spans.items()}
+        return {task_id: {tipe: timedelta(seconds=averages[tipe][i]) for tipe in spans}
+                for i, task_id in enumerate(self.task_ids[idx].tolist())}
+
+    @staticmethod
+    def _spent_time(period: str, days: np.ndarray, durations: np.ndarray) -> timedelta | None:
+        """`Entry.eval_average_spent_time` of entries that all have a duration."""
+        if not days.size:
+            return None
+        daily = durations.sum() / np.unique(days).size
+        first, last = int(days.min()), int(days.max())
+
+        match period:
+            case 'daily':
+                return seconds(daily)
+
+            case 'weekly':
+                last = int(jcalendar.week_start(last)) - 1  # the friday before the last day
+                if last - first < 7:
+                    return seconds(daily * 7)
+                first = int(jcalendar.week_start(first)) + 7  # the saturday after the first day
+                in_range = (days >= first) & (days <= last)
+                return seconds(durations[in_range].sum() / ((last - first + 1) // 7))
+
+            case 'monthly':
+                first_idx = int(jcalendar.month_index(first)) + (1 if jcalendar.to_jalali(first)[2] > 15 else 0)
+                last_idx = int(jcalendar.month_index(last)) - 1
+                if first_idx >= last_idx:
+                    return seconds(daily * 30)
+                starts = jcalendar.month_starts()
+                in_range = (days >= starts[first_idx]) & (days < starts[last_idx + 1])
+                return seconds(durations[in_range].sum() / (last_idx - first_idx + 1))
+
+    def averages(self, by: str = 'group') -> dict[str, dict[str, timedelta]]:
+        """The daily, weekly and monthly spent time of each group or genre, or None without entries."""
+        names, codes = self.labels(by)
+        has = ~np.isnan(self.duration)
+        result = dict()
+        for code, name in enumerate(names):
+            mask = has & (codes == code)
+            result[name] = {period: self._spent_time(period, self.day[mask], self.duration[mask])
+                            for period in PERIODS}
+        return result
+
+    def spent_time(self, period: str, group: str = 'productive', sheet: Sheet = None) -> timedelta | None:
+        """Counterpart of `Entry.eval_average_spent_time`, limited to a sheet of the loaded ones if given."""
+        assert period in PERIODS
+        names, codes = self.labels('group')
+        mask = ~np.isnan(self.duration) & (codes == (names.index(group) if group in names else -1))
+        if sheet is not None:
+            sheets = np.array([task.sheet_id for task in self.tasks], dtype=np.int64)
+            mask &= sheets[self.task] == sheet.pk
+        return self._spent_time(period, self.day[mask], self.duration[mask])
+
+    def buckets(self, period: str = 'week', by: str = 'group') -> dict[tuple[str, date], tuple[timedelta, int]]:
+        """
+        The `WeeklyStat` or `MonthlyStat` figures of each group or genre: the total duration
+        and the number of days with time spent, by the start of each jalali week or month.
+        """
+        assert period in ('week', 'month')
+        names, codes = self.labels(by)
+        has = ~np.isnan(self.duration)
+        # the totals of each (label, day) first, so that days are counted once per bucket
+        pairs, inverse = np.unique(codes[has] * KEY_SPAN + self.day[has], return_inverse=True)
+        pair_totals = np.bincount(inverse, weights=self.duration[has], minlength=pairs.size)
+        pair_codes, pair_days = np.divmod(pairs, KEY_SPAN)
+        starts = jcalendar.week_start(pair_days) if period == 'week' else jcalendar.month_start(pair_days)
+        keys, inverse = np.unique(pair_codes * KEY_SPAN + starts, return_inverse=True)
+        totals = np.bincount(inverse, weights=pair_totals, minlength=keys.size)
+        days = np.bincount(inverse, minlength=keys.size)
+        key_codes, key_starts = np.divmod(keys, KEY_SPAN)
+        return {(names[code], date.fromordinal(start)): (timedelta(seconds=total), count)
+                for code, start, total, count in zip(key_codes.tolist(), key_starts.tolist(), totals.tolist(),
+                                                     days.tolist())}
+
+    def rolling(self, window: int = 7, by: str = 'group') -> tuple[list[str], date, np.ndarray]:
+        """
+        Trailing `window`-day averages of the daily totals of each group or genre, in seconds,
+        for every day from the first entry through the last. Row i is names[i] and column j
+        the day `first + j`; the first days average over the days elapsed so far.
+        """
+        names, codes = self.labels(by)
+        has = ~np.isnan(self.duration)
+        if not has.any():
+            return names, None, np.zeros((len(names), 0))
+        first = int(self.day[has].min())
+        span = int(self.day[has].max()) - first + 1
+        daily = np.bincount(codes[has] * span + self.day[has] - first, weights=self.duration[has],
+                            minlength=len(names) * span).reshape(len(names), span)
+        cumulative = np.concatenate([np.zeros((len(names), 1)), np.cumsum(daily, axis=1)], axis=1)
+        ends = np.arange(1, span + 1)
+        starts = np.maximum(ends - window, 0)
+        return names, date.fromordinal(first), (cumulative[:, ends] - cumulative[:, starts]) / (ends - starts)
+
+    def streaks(self, today: date = None) -> dict[int, tuple[int, int]]:
+        """
+        The current and the longest run of consecutive days with time spent, by task id.
+        A run is current while it reaches today or yesterday, since today may not be filled yet.
+        """
+        today = (today or timezone.localdate()).toordinal()
+        has = np.nan_to_num(self.duration) > 0
+        keys = np.unique(self.task[has].astype(np.int64) * KEY_SPAN + self.day[has])  # by task, then by day
+        current = np.zeros(len(self.tasks), dtype=np.int64)
+        longest = np.zeros(len(self.tasks), dtype=np.int64)
+        if keys.size:
+            tasks, days = np.divmod(keys, KEY_SPAN)
+            breaks = np.flatnonzero((np.diff(tasks) != 0) | (np.diff(days) != 1)) + 1
+            starts, ends = np.concatenate([[0], breaks]), np.concatenate([breaks, [keys.size]])
+            lengths, run_tasks = ends - starts, tasks[starts]
+            np.maximum.at(longest, run_tasks, lengths)
+            live = days[ends - 1] >= today - 1
+            current[run_tasks[live]] = lengths[live]
+        return {task_id: (c, m) for task_id, c, m in zip(self.task_ids.tolist(), current.tolist(), longest.tolist())}
+
+    def summary(self, today: date = None) -> dict:
+        """Every figure above as plain JSON types, durations in seconds."""
+        def secs(value: timedelta | None) -> float | None:
+            return None if value is None else round(value.total_seconds(), 3)
+
+        averages, streaks = self.task_averages(), self.streaks(today)
+        tipes = {'*': 'overall', 'w': 'weekly', 'm': 'monthly', 'y': 'yearly'}
+        return {
+            'entries': len(self),
+            'tasks': {task.name: {
+                'group': task.group, 'genre': task.genre,
+                'averages': {tipes[tipe]: secs(avg) for tipe, avg in averages.get(task.pk, dict()).items()},
+                'streak': dict(zip(('current', 'longest'), streaks[task.pk])),
+            } for task in self.tasks},
+            **{f'{by}s': {name: {period: secs(avg) for period, avg in figures.items()}
+                          for name, figures in self.averages(by).items()} for by in ('group', 'genre')},
+        }
@@ -1,8 +1,34 @@
-import gspread
+"""
+The gspread client, authorized on first use and then shared by every google backend of the
+process. Importing this module reads no credentials and does not import gspread.
+"""
+import threading
 
 from django.conf import settings
 
-gc = gspread.oauth(
-    credentials_filename=str(settings.CREDENTIALS_FILEPATH),
-    authorized_user_filename=str(settings.AUTHORIZATION_FILEPATH)
-)
+_client = None
+_lock = threading.Lock()
+
+
+def client():
+    """
+    The authorized gspread client. The first call reads the credentials, refreshing the token
+    or running the browser flow if it has to; later calls reuse the client and its token,
+    which refreshes itself when it expires.
+    """
+    global _client
+    if _client is None:
+        with _lock:  # sheets synced on worker threads would each authorize otherwise
+            if _client is None:
+                import gspread
+                _client = gspread.oauth(
+                    credentials_filename=str(settings.CREDENTIALS_FILEPATH),
+                    authorized_user_filename=str(settings.AUTHORIZATION_FILEPATH)
+                )
+    return _client
+
+
+def __getattr__(name: str):
+    if name == 'gc':  # `from sheets.client.auth import gc` keeps working, authorizing on first use
+        return client()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,151 @@
+"""
+Sheet backends for ProdClient. A backend opens the sheet, reports its revision, returns its
+values and writes batches of cell changes.
+"""
+import os
+
+from pathlib import Path
+from typing import Union
+from django.conf import settings
+from datetime import time, timedelta, datetime, date
+from sheets.client import auth
+from sheets.client.snapshot import parse_range
+from utils.string import stringify_timedelta, format_date
+
+
+class SheetBackend:
+    quota = False  # whether calls count against the Sheets API quotas
+
+    def open(self):
+        raise NotImplementedError
+
+    @property
+    def revision(self) -> str:
+        """Changes whenever the content of the sheet changes."""
+        raise NotImplementedError
+
+    def get_all_values(self) -> list[list[str]]:
+        raise NotImplementedError
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        """The rows of each A1 range. Falls back to slicing all the values of the sheet."""
+        values = self.get_all_values()
+        result = list()
+        for address in ranges:
+            row1, col1, row2, col2 = parse_range(address)
+            rows = values[row1:None if row2 is None else row2 + 1]
+            result.append([row[col1:col2 + 1] for row in rows])
+        return result
+
+    def batch_update(self, data: list[dict]):
+        """data is a list of {'range': <A1 address>, 'values': [[<value>]]} as gspread takes it."""
+        raise NotImplementedError
+
+
+class GoogleBackend(SheetBackend):
+    quota = True
+
+    def __init__(self, name: str = None):
+        self.name = settings.SHEET_NAME if name is None else name
+        self.worksheet = None
+
+    def open(self):
+        self.worksheet = auth.client().open(self.name).sheet1
+
+    @property
+    def revision(self) -> str:
+        """
+        Built on the Drive `modifiedTime` of the spreadsheet, fetched anew on each access: one
+        Drive API call, outside the Sheets quotas. gspread's `lastUpdateTime` is only read
+        when the spreadsheet is opened, so it would not change within a handle.
+        """
+        from gspread.urls import DRIVE_FILES_API_V3_URL  # gspread is imported on first use
+        spreadsheet = self.worksheet.spreadsheet
+        response = spreadsheet.client.request('get', f'{DRIVE_FILES_API_V3_URL}/{spreadsheet.id}',
+                                              params={'fields': 'modifiedTime', 'supportsAllDrives': True})
+        return f'{spreadsheet.id}:{self.worksheet.id}:{response.json()["modifiedTime"]}'
+
+    def get_all_values(self) -> list[list[str]]:
+        return self.worksheet.get_all_values()
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        return [list(value_range) for value_range in self.worksheet.batch_get(ranges)]
+
+    def batch_update(self, data: list[dict]):
+        self.worksheet.batch_update(data, value_input_option='USER_ENTERED')
+
+
+class XlsxBackend(SheetBackend):
+    """
+    A local .xlsx file structured like the google sheet. Values are loaded with openpyxl's
+    read-only mode; writes load the workbook once, set only the given cells and save it.
+
+    openpyxl saves formulas without their cached results, which the values are read from, so
+    writes to a workbook holding formulas are refused rather than blanking those cells.
+    """
+
+    def __init__(self, path: Union[str, Path] = None):
+        self.path = Path(settings.SHEET_XLSX_PATH if path is None else path)
+
+    def open(self):
+        if not self.path.is_file():
+            raise FileNotFoundError(f'sheet file `{self.path}` does not exist.')
+
+    @property
+    def revision(self) -> str:
+        stat = self.path.stat()
+        return f'{self.path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}'
+
+    @staticmethod
+    def stringify(value) -> str:
+        if value is None:
+            return str()
+        elif isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        elif isinstance(value, timedelta):
+            return stringify_timedelta(value)
+        elif isinstance(value, time):
+            return stringify_timedelta(timedelta(hours=value.hour, minutes=value.minute, seconds=value.second))
+        elif isinstance(value, (datetime, date)):
+            return format_date(value)
+        return str(value)
+
+    def get_all_values(self) -> list[list[str]]:
+        import openpyxl  # slow to import, and only the xlsx backend needs it
+        workbook = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            rows = [[self.stringify(value) for value in row]
+                    for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+
+        # trim trailing empty rows and columns like `Worksheet.get_all_values`
+        while rows and not any(rows[-1]):
+            rows.pop()
+        width = max((max((idx + 1 for idx, v in enumerate(row) if v), default=0) for row in rows), default=0)
+        return [row[:width] + [str()] * (width - len(row)) for row in rows]
+
+    def batch_update(self, data: list[dict]):
+        if not data:
+            return
+        import openpyxl
+        workbook = openpyxl.load_workbook(self.path)
+        for sheet in workbook.worksheets:
+            formula = next((cell.coordinate for row in sheet.iter_rows() for cell in row
+                            if cell.data_type == 'f'), None)
+            if formula is not None:
+                raise ValueError(f'`{self.path}` has a formula in {sheet.title}!{formula}; saving it would drop '
+                                 f'the cached results of its formulas. replace them with values to write to it.')
+        worksheet = workbook.worksheets[0]
+        for change in data:
+            worksheet[change['range']] = change['values'][0][0]
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        workbook.save(tmp_path)
+        os.replace(tmp_path, self.path)
+
+
+BACKENDS = {'google': GoogleBackend, 'xlsx': XlsxBackend}
+
+
+def get_backend(name: str = None) -> SheetBackend:
+    return BACKENDS[settings.SHEET_BACKEND if name is None else name]()
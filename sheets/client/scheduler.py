@@ -0,0 +1,175 @@
+"""
+Keeps the calls to a quota limited sheet backend within the Sheets API quotas. Reads and
+writes take a token from buckets of their own, identical reads in flight at the same time
+share one request, and calls answered with a quota or server error are retried with
+jittered exponential backoff.
+"""
+import time
+import random
+import threading
+
+from typing import Callable
+from django.conf import settings
+from concurrent.futures import Future
+from sheets.client.backends import SheetBackend
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+_shared_buckets: dict[str, 'TokenBucket'] = dict()
+_shared_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Allows `per_minute` calls a minute, in bursts of at most `capacity`."""
+
+    def __init__(self, per_minute: int, capacity: int = None):
+        self.rate = per_minute / 60
+        # a full minute's burst on top of the refill would overshoot a per-minute quota
+        self.capacity = max(1, per_minute // 4) if capacity is None else capacity
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes a token, sleeping until one is available. Returns the seconds slept."""
+        slept = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return slept
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            slept += delay
+
+
+def shared_bucket(kind: str, per_minute: int) -> TokenBucket:
+    """One bucket per kind for the whole process, as every sheet is read with the same credentials."""
+    with _shared_lock:
+        if kind not in _shared_buckets:
+            _shared_buckets[kind] = TokenBucket(per_minute)
+        return _shared_buckets[kind]
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether the error answers a call with a quota or server error, as gspread's APIError does."""
+    # told apart by its response rather than its class, which would import gspread with any backend
+    return getattr(getattr(error, 'response', None), 'status_code', None) in RETRY_STATUSES
+
+
+class ScheduledBackend(SheetBackend):
+    def __init__(self, backend: SheetBackend, read_per_minute: int = None, write_per_minute: int = None,
+                 max_retries: int = None, base_backoff: float = 1.0, max_backoff: float = 64.0):
+        self.backend = backend
+        self.quota = backend.quota
+        self.reads = shared_bucket('read', settings.SHEETS_READ_REQUESTS_PER_MINUTE) \
+            if read_per_minute is None else TokenBucket(read_per_minute)
+        self.writes = shared_bucket('write', settings.SHEETS_WRITE_REQUESTS_PER_MINUTE) \
+            if write_per_minute is None else TokenBucket(write_per_minute)
+        self.max_retries = settings.SHEETS_MAX_RETRIES if max_retries is None else max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.random = random.Random()
+        self.lock = threading.Lock()
+        self.in_flight: dict[tuple, Future] = dict()
+
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.throttle_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.retries = 0
+        self.coalesced = 0
+
+    def _take(self, bucket: TokenBucket):
+        with self.lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        slept = 0.0
+        try:
+            slept = bucket.acquire()
+        finally:
+            with self.lock:
+                self.queue_depth -= 1
+                self.throttle_seconds += slept
+
+    def _call(self, bucket: TokenBucket, func: Callable, *args):
+        attempt = 0
+        while True:
+            self._take(bucket)
+            try:
+                return func(*args)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                with self.lock:
+                    self.retries += 1
+                    self.backoff_seconds += delay
+                time.sleep(delay)
+                attempt += 1
+
+    def _read(self, key: tuple, func: Callable, *args):
+        """Runs a read, or waits for the same read another thread already has in flight."""
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._call(self.reads, func, *args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def open(self):
+        return self._read(('open',), self.backend.open)
+
+    @property
+    def revision(self) -> str:
+        # not a values read: it takes no token of the Sheets read quota
+        return self.backend.revision
+
+    def get_all_values(self) -> list[list[str]]:
+        return self._read(('get_all_values',), self.backend.get_all_values)
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        return self._read(('batch_get', *ranges), self.backend.batch_get, ranges)
+
+    def batch_update(self, data: list[dict]):
+        # only the last value written to a cell matters
+        latest = {change['range'].upper(): change for change in data}
+        with self.lock:
+            self.coalesced += len(data) - len(latest)
+        return self._call(self.writes, self.backend.batch_update, list(latest.values()))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'max_queue_depth': self.max_queue_depth, 'throttle_seconds': round(self.throttle_seconds, 4),
+                    'backoff_seconds': round(self.backoff_seconds, 4), 'retries': self.retries,
+                    'coalesced': self.coalesced}
+
+    def report(self) -> str:
+        stats = self.stats()
+        return f'{stats["retries"]} sheet calls retried, {stats["coalesced"]} coalesced, ' \
+               f'{stats["throttle_seconds"]:.1f}s throttled, {stats["backoff_seconds"]:.1f}s backed off, ' \
+               f'at most {stats["max_queue_depth"]} calls waiting.'
+
+
+def schedule(backend: SheetBackend) -> SheetBackend:
+    """Wraps backends which are subject to the Sheets API quotas."""
+    if backend.quota and not isinstance(backend, ScheduledBackend):
+        return ScheduledBackend(backend)
+    return backend
@@ -1,51 +1,144 @@
-import pickle
+import threading
 
-from typing import Union
+from pathlib import Path
+from typing import Union, Sequence
 
 import jdatetime
 from django.conf import settings
-from sheets.client.auth import gc
 from django.utils import timezone
-from sheets.models import Task, Entry
-from gspread.worksheet import Worksheet
+from sheets import rollup, ingest
+from sheets.models import Sheet, Task, Entry, AvgStat
+from sheets.client.snapshot import SheetSnapshot, parse_range, column_letters
+from sheets.client.scheduler import schedule
+from sheets.client.backends import SheetBackend
 from datetime import timedelta, date, datetime
-from utils.string import stringify_timedelta, timedelta_from_str
+from utils.datetime import date_from_str
+from utils.string import stringify_timedelta
+
+SNAPSHOT_DIR = settings.BASE_DIR / 'data'
+
+
+class CellBuffer:
+    """
+    Collects the cell changes of a run and sends them in as few `batch_update` calls
+    as possible. Cells whose new value equals the one already fetched into the client's
+    data are skipped.
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self, client: 'ProdClient'):
+        self.client = client
+        self.pending: dict[str, str] = dict()
+        self.written = 0
+        self.skipped = 0
+        self.lock = threading.Lock()  # stages may buffer and flush from different threads
+
+    def update(self, address: str, value: str):
+        with self.lock:
+            self.pending[address.upper()] = value
+
+    def is_stale(self, address: str, value: str) -> bool:
+        if not self.client.snapshot.covers(address):
+            return True
+        try:
+            return self.client.get_cell(address) != value
+        except IndexError:  # beyond the fetched range
+            return value != str()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, dict()
+        to_write = [{'range': address, 'values': [[value]]}
+                    for address, value in pending.items() if self.is_stale(address, value)]
+        with self.lock:
+            self.skipped += len(pending) - len(to_write)
+        for idx in range(0, len(to_write), self.BATCH_SIZE):
+            batch = to_write[idx:idx + self.BATCH_SIZE]
+            self.client.backend.batch_update(batch)
+            with self.lock:
+                self.written += len(batch)
+
+    def report(self) -> str:
+        return f'{self.written} cells written, {self.skipped} cells skipped.'
+
+
+class TaskChanges:
+    def __init__(self):
+        self.created: list[Task] = list()
+        self.renamed: list[tuple[str, str]] = list()
+        self.moved: list[Task] = list()
+        self.archived: list[Task] = list()
+        self.unarchived: list[Task] = list()
+
+    def __bool__(self):
+        return any((self.created, self.renamed, self.moved, self.archived, self.unarchived))
+
+    def __str__(self):
+        summary = f'{len(self.created)} tasks created, {len(self.renamed)} renamed, {len(self.moved)} moved, ' \
+                  f'{len(self.archived)} archived, {len(self.unarchived)} unarchived.'
+        # a rename carries the entries of the old name over, so each one is listed to be checked
+        return '\n'.join([summary] + [f'renamed `{old}` to `{new}`' for old, new in self.renamed])
+
+    def __repr__(self):
+        return str(self)
 
 
 class ProdClient:
-    def __init__(self):
-        self.data = list()
-        self.sheet: Union[Worksheet, None] = None
+    # task names and baseline durations, today's durations and the previous day's durations.
+    # the analytical block lives in columns A and B as well.
+    RANGES = ['A:B', 'D:D', 'F:F']
+
+    def __init__(self, backend: SheetBackend = None, sheet: Sheet = None, snapshot_dir: Path = None):
+        self.sheet: Sheet = Sheet.default() if sheet is None else sheet
+        self.snapshot_dir: Path = SNAPSHOT_DIR if snapshot_dir is None else snapshot_dir
+        self.snapshot = SheetSnapshot(list())
+        self.ranges: list[str] = list(self.RANGES)
+        self.backend: SheetBackend = schedule(self.sheet.get_backend() if backend is None else backend)
         self._groups: Union[dict, None] = None
+        self.buffer = CellBuffer(self)
+        self.task_changes: Union[TaskChanges, None] = None
 
     def set_sheet(self):
-        sheet = gc.open(settings.SHEET_NAME)
-        self.sheet = sheet.sheet1
+        self.backend.open()
+
+    @property
+    def data(self) -> list[list[str]]:
+        return self.snapshot.rows()
+
+    @data.setter
+    def data(self, rows: list[list[str]]):
+        self.snapshot = SheetSnapshot(rows)
+        self._groups = None
+
+    def declare_range(self, address: str):
+        """Adds an A1 range to the ones fetched by `eval`, for stages which read other cells."""
+        if address not in self.ranges:
+            self.ranges.append(address)
 
     def eval(self):
-        self.data: list[list[str]] = self.sheet.get_all_values()
+        self.snapshot = SheetSnapshot.from_ranges(self.ranges, self.backend.batch_get(self.ranges))
         self._groups = None
 
-    def setup(self):
+    def setup(self, cache: bool = True):
         self.set_sheet()
+        # taken once, before the values are fetched: a change made meanwhile is fetched next time
+        revision = self.revision
+        if cache and self.load_snapshot(revision):
+            return
         self.eval()
+        self.save_snapshot(revision)
 
     def get_cell(self, address: str) -> str:
-        row = int(address[1:]) - 1
-        col = ord(address[0].upper()) - 65
-        return self.data[row][col]
+        return self.snapshot.cell(address)
 
-    def get_col_cells(self, col: str) -> list[str]:
-        col = ord(col.upper()) - 65
-        return [self.data[row][col] for row in range(len(self.data))]
+    def get_col_cells(self, col: str, trim: bool = False) -> Sequence[str]:
+        return self.snapshot.column(col, trim)
 
-    def get_row_cells(self, row: int) -> list[str]:
-        return self.data[row]
+    def get_row_cells(self, row: int) -> Sequence[str]:
+        return self.snapshot.row(row)
 
     def _eval_task_groups(self):
-        task_column = self.get_col_cells('A')
-        while not task_column[-1]:
-            task_column.pop()
+        task_column = self.get_col_cells('A', trim=True)
 
         indexes = list()
         start_index = 2
@@ -77,29 +170,43 @@ class ProdClient:
             if task_row in range(indexes[0], indexes[1] + 1):
                 return g
 
-    def picklify(self):
-        folder = settings.BASE_DIR / 'data'
-        folder.mkdir(exist_ok=True)
-        with open(folder / 'sheet.pickle', 'wb') as file:
-            pickle.dump(self.sheet, file)
-        with open(folder / 'data.pickle', 'wb') as file:
-            pickle.dump(self.data, file)
-
-    def unpicklify(self):
-        folder = settings.BASE_DIR / 'data'
-        folder.mkdir(exist_ok=True)
-        with open(folder / 'sheet.pickle', 'rb') as file:
-            self.sheet = pickle.load(file)
-        with open(folder / 'data.pickle', 'rb') as file:
-            self.data = pickle.load(file)
-
-    def renew_tasks(self):
-        task_columns = self.get_col_cells('A')
-        while not task_columns[-1]:
-            task_columns.pop()
-
-        existing_tasks = {task.name: {'task': task, 'found': False} for task in self.tasks}
-        to_create_tasks = list()
+    @property
+    def revision(self) -> str:
+        return f'{self.backend.revision}|{",".join(self.ranges)}'
+
+    @property
+    def snapshot_path(self):
+        return self.snapshot_dir / f'snapshot-{self.sheet.pk}.json'
+
+    def save_snapshot(self, revision: str = None):
+        self.snapshot_dir.mkdir(exist_ok=True)
+        self.snapshot.dump(self.snapshot_path, self.revision if revision is None else revision)
+
+    def load_snapshot(self, revision: str = None) -> bool:
+        snapshot = SheetSnapshot.load(self.snapshot_path, self.revision if revision is None else revision)
+        if snapshot is None:
+            return False
+        self.snapshot = snapshot
+        self._groups = None
+        return True
+
+    def renew_tasks(self, renames: bool = None) -> 'TaskChanges':
+        """
+        Syncs the tasks with the task rows of the sheet, indexing the tasks by name and writing
+        only the ones which changed. Unknown names are created and missing ones archived. With
+        renames, settings.DETECT_TASK_RENAMES by default, a row with an unknown name which sits
+        on the row of a missing task of the same group and genre is taken as that task renamed,
+        keeping its entries. The rollup buckets of the groups a task moved between are
+        recomputed over its whole history.
+        """
+        renames = settings.DETECT_TASK_RENAMES if renames is None else renames
+        task_columns = self.get_col_cells('A', trim=True)
+        by_name = {task.name: task for task in self.tasks}
+        changes = TaskChanges()
+        changed: dict[int, Task] = dict()
+        regrouped: dict[int, str] = dict()  # the previous group of the tasks which moved to another one
+
+        unmatched_rows = list()
         for idx, cell in enumerate(task_columns):
             index = idx + 1
             if index == 1 or cell == str():
@@ -110,32 +217,50 @@ class ProdClient:
                 break
 
             genre = cell.split(': ')[0] if ': ' in cell else ''
-            found = False
-            for name, kw in existing_tasks.items():
-                if name == cell:
-                    task = kw['task']
-                    if not task.genre and genre:
-                        task.genre = genre
-                    task.row = index
-                    task.archived = False
-                    task.group = group
-                    kw['found'] = True
-                    found = True
-                    break
-            if not found:
-                to_create_tasks.append(Task(name=cell, row=index, group=group, genre=genre))
-
-        for kw in existing_tasks.values():
-            task = kw['task']
-            if not kw['found']:
-                task.archived = True
-
-        Task.objects.bulk_update([t['task'] for t in existing_tasks.values()], ['row', 'archived', 'group', 'genre'])
-        Task.objects.bulk_create(to_create_tasks)
+            task = by_name.pop(cell, None)
+            if task is None:
+                unmatched_rows.append((index, cell, group, genre))
+                continue
+
+            if task.archived:
+                changes.unarchived.append(task)
+            elif task.row != index or task.group != group:
+                changes.moved.append(task)
+            if task.archived or task.row != index or task.group != group or (not task.genre and genre):
+                task.genre = task.genre or genre
+                if task.group != group:
+                    regrouped[task.id] = task.group
+                task.row, task.group, task.archived = index, group, False
+                changed[task.id] = task
+
+        vacated = {(task.row, task.group, task.genre): task for task in by_name.values() if not task.archived}
+        to_create_tasks = list()
+        for index, name, group, genre in unmatched_rows:
+            task = vacated.pop((index, group, genre), None) if renames else None
+            if task is None:
+                to_create_tasks.append(Task(sheet=self.sheet, name=name, row=index, group=group, genre=genre))
+                continue
+            changes.renamed.append((task.name, name))
+            task.name = name
+            changed[task.id] = task
+
+        for task in vacated.values():
+            task.archived = True
+            changes.archived.append(task)
+            changed[task.id] = task
+
+        Task.objects.bulk_update(list(changed.values()), ['name', 'row', 'archived', 'group', 'genre'])
+        changes.created = Task.objects.bulk_create(to_create_tasks)
+        # the history of a moved task leaves the buckets of its old group for the ones of its new group
+        rollup.regroup(self.sheet, regrouped, set(regrouped.values()) | {changed[pk].group for pk in regrouped})
+        if changes:
+            Sheet.touch([self.sheet.pk])
+        self.task_changes = changes
+        return changes
 
     @property
     def tasks(self):
-        return Task.objects.all()
+        return Task.objects.filter(sheet=self.sheet)
 
     @classmethod
     def create_initial_entries(cls):
@@ -168,55 +293,112 @@ class ProdClient:
         now = timezone.localtime()
         entry_date = now.date() if today else now.date() - timedelta(days=1)
         
+        rollup.ensure(self.sheet)  # the stages after this one read the rollups
         tasks = self.tasks.filter(archived=False)
-        to_create_entries = list()
+        to_create_entries, malformed = list(), list()
         for task in tasks:
-            cell = self.get_cell(f'D{task.row}')
-            if not cell.strip():
+            try:
+                duration = self.snapshot.duration(f'D{task.row}')
+            except ValueError as e:  # every malformed cell is reported before anything is written
+                malformed.append(str(e))
                 continue
-            duration = timedelta_from_str(cell)
             if not duration:
                 continue
 
             to_create_entries.append(Entry(task=task, duration=duration, date=entry_date))
-
-        existing_entries = Entry.objects.filter(date=entry_date).values_list('task_id', flat=True)
-        to_create_entries = [entry for entry in to_create_entries if entry.task_id not in existing_entries]
-        Entry.objects.bulk_create(to_create_entries, ignore_conflicts=True)
-
-        to_update_entries = [entry for entry in to_create_entries if entry.task_id in existing_entries]
-        Entry.objects.bulk_update(to_update_entries, ['duration'])
-
-        Entry.eval_all_progress()
+        if malformed:
+            raise ValueError('\n'.join(malformed))
+
+        ingest.upsert_entries(to_create_entries)
+
+    def dated_durations(self, columns: str, first_date: date = None, last_date: date = None,
+                        jalali: bool = True) -> list[Entry]:
+        """
+        Entries out of history columns whose header cell holds a date, such as `G:Z`. Raises
+        ValueError naming every column whose header is not a date before reading any duration,
+        then naming every task cell which holds no duration. Used by the backfill command.
+        """
+        if columns not in self.ranges:
+            self.declare_range(columns)
+            self.eval()
+        _, col1, _, col2 = parse_range(columns)
+        tasks = list(self.tasks.filter(archived=False))
+
+        dates, malformed = dict(), list()
+        for col in range(col1, min(col2 + 1, self.snapshot.width)):
+            header = self.snapshot.column(col)[:1]
+            if not header or not header[0].strip():
+                continue
+            try:
+                dates[col] = date_from_str(header[0], jalali)
+            except ValueError:
+                malformed.append(f'column {column_letters(col)} is headed `{header[0]}`, which is not a date.')
+        if malformed:
+            raise ValueError('\n'.join(malformed))
+
+        entries = list()
+        for col, entry_date in dates.items():
+            if (first_date and entry_date < first_date) or (last_date and entry_date > last_date):
+                continue
+            height = len(self.snapshot.durations(col))
+            for task in tasks:
+                if task.row > height:
+                    continue
+                try:
+                    duration = self.snapshot.duration(f'{column_letters(col)}{task.row}')
+                except ValueError as e:
+                    malformed.append(str(e))
+                    continue
+                if duration:
+                    entries.append(Entry(task=task, duration=duration, date=entry_date))
+        if malformed:
+            raise ValueError('\n'.join(malformed))
+        return entries
 
     def update_average_cells(self):
+        """Writes the overall averages, kept in `AvgStat` by the rollups, or the trailing ones."""
         tasks = self.tasks.filter(archived=False).order_by('row')
+        window = settings.SHEET_AVERAGE_WINDOW
+        if window:
+            trailing = Task.trailing_averages([window], tasks)
+            averages = {task_id: figures[window] for task_id, figures in trailing.items()}
+        else:
+            averages = dict(AvgStat.objects.filter(task__in=tasks, tipe='*').values_list('task_id', 'avg'))
         for task in tasks:
-            average = task.average()
+            average = averages.get(task.pk)
             if not average:
                 duration = self.get_cell(f'B{task.row}')
             else:
                 duration = stringify_timedelta(average)
 
-            self.sheet.update_acell(f'F{task.row}', self.get_cell(f'D{task.row}'))
-            self.sheet.update_acell(f'D{task.row}', str())
-            self.sheet.update_acell(f'B{task.row}', duration)
+            self.buffer.update(f'F{task.row}', self.get_cell(f'D{task.row}'))
+            self.buffer.update(f'D{task.row}', str())
+            self.buffer.update(f'B{task.row}', duration)
 
     def eval_average_spent_time(self):
         indexes = self.groups['analytical']
         row_range = list(range(indexes[0], indexes[-1] + 1))
 
-        daily = stringify_timedelta(Entry.eval_average_spent_time('daily'))
-        self.sheet.update_acell(f'B{row_range[-8]}', daily)
-        daily = stringify_timedelta(Entry.eval_average_spent_time('daily', alternatives=True))
-        self.sheet.update_acell(f'B{row_range[-3]}', daily)
-
-        weekly = stringify_timedelta(Entry.eval_average_spent_time('weekly'))
-        self.sheet.update_acell(f'B{row_range[-7]}', weekly)
-        weekly = stringify_timedelta(Entry.eval_average_spent_time('weekly', alternatives=True))
-        self.sheet.update_acell(f'B{row_range[-2]}', weekly)
-
-        monthly = stringify_timedelta(Entry.eval_average_spent_time('monthly'))
-        self.sheet.update_acell(f'B{row_range[-6]}', monthly)
-        monthly = stringify_timedelta(Entry.eval_average_spent_time('monthly', alternatives=True))
-        self.sheet.update_acell(f'B{row_range[-1]}', monthly)
+        window = settings.SHEET_AVERAGE_WINDOW
+        trailing = Entry.trailing_spent_time([window], self.sheet) if window else None
+        for group, row in (('productive', row_range[-8]), ('alternative', row_range[-3])):
+            if trailing is None:
+                daily = rollup.average_spent_time('daily', group, self.sheet)
+            else:  # a group without time in the window keeps its cell
+                daily = trailing.get(group, dict()).get(window)
+            if daily is not None:
+                self.buffer.update(f'B{row}', stringify_timedelta(daily))
+
+        weekly = stringify_timedelta(rollup.average_spent_time('weekly', 'productive', self.sheet))
+        self.buffer.update(f'B{row_range[-7]}', weekly)
+        weekly = stringify_timedelta(rollup.average_spent_time('weekly', 'alternative', self.sheet))
+        self.buffer.update(f'B{row_range[-2]}', weekly)
+
+        monthly = stringify_timedelta(rollup.average_spent_time('monthly', 'productive', self.sheet))
+        self.buffer.update(f'B{row_range[-6]}', monthly)
+        monthly = stringify_timedelta(rollup.average_spent_time('monthly', 'alternative', self.sheet))
+        self.buffer.update(f'B{row_range[-1]}', monthly)
+
+    def flush(self) -> str:
+        self.buffer.flush()
+        return self.buffer.report()
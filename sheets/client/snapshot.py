@@ -0,0 +1,245 @@
+"""
+Column-wise, in-memory snapshot of the values of a worksheet, addressed in A1 notation.
+Column and row lookups return views over the stored columns instead of new lists.
+"""
+import re
+import os
+import json
+
+from pathlib import Path
+from datetime import timedelta
+from functools import lru_cache
+from typing import Iterator, Sequence, Union
+from utils.string import timedelta_from_str
+
+A1_PATTERN = re.compile(r'^([A-Za-z]+)(\d*)$')
+SNAPSHOT_VERSION = 2
+
+
+def column_index(letters: str) -> int:
+    """Zero-based index of a column. A -> 0, Z -> 25, AA -> 26"""
+    index = 0
+    for char in letters.upper():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def column_letters(index: int) -> str:
+    """Reverse of `column_index`."""
+    letters = str()
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+@lru_cache(maxsize=4096)
+def parse_address(address: str) -> tuple[int, int]:
+    """Zero-based (row, col) of an A1 address such as `AA12`."""
+    match = A1_PATTERN.match(address.strip())
+    if match is None or not match[2]:
+        raise ValueError(f'`{address}` is not an A1 address.')
+    return int(match[2]) - 1, column_index(match[1])
+
+
+def parse_range(address: str) -> tuple[int, int, Union[int, None], int]:
+    """
+    Zero-based (first row, first col, last row, last col) of an A1 range such as `B2:F40`.
+    Rows may be left out as in `A:B`, the last row is then None meaning the range is open.
+    """
+    corners = list()
+    for part in address.split(':', 1):
+        match = A1_PATTERN.match(part.strip())
+        if match is None:
+            raise ValueError(f'`{address}` is not an A1 range.')
+        corners.append((int(match[2]) - 1 if match[2] else None, column_index(match[1])))
+    (row1, col1), (row2, col2) = corners if len(corners) == 2 else corners * 2
+    if row1 is None or row2 is None:
+        return row1 or 0, min(col1, col2), None, max(col1, col2)
+    return min(row1, row2), min(col1, col2), max(row1, row2), max(col1, col2)
+
+
+class View(Sequence):
+    """Read-only window over a slice of a list."""
+    __slots__ = ('_items', '_start', '_stop')
+
+    def __init__(self, items: list, start: int = 0, stop: int = None):
+        self._items = items
+        self._start = max(start, 0)
+        self._stop = len(items) if stop is None else min(stop, len(items))
+
+    def __len__(self) -> int:
+        return max(self._stop - self._start, 0)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[idx] for idx in range(start, stop, step)]
+            return View(self._items, self._start + start, self._start + stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('view index out of range')
+        return self._items[self._start + index]
+
+    def __iter__(self) -> Iterator:
+        for idx in range(self._start, self._stop):
+            yield self._items[idx]
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class RowView(Sequence):
+    """One row of a column-wise snapshot."""
+    __slots__ = ('_columns', '_row')
+
+    def __init__(self, columns: list[list[str]], row: int):
+        self._columns = columns
+        self._row = row
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [column[self._row] for column in self._columns[index]]
+        return self._columns[index][self._row]
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class SheetSnapshot:
+    def __init__(self, rows: list[list[str]]):
+        self.height = len(rows)
+        self.width = max(map(len, rows), default=0)
+        self.columns: list[list[str]] = [
+            [row[col] if col < len(row) else str() for row in rows] for col in range(self.width)
+        ]
+        self._durations: dict[int, list[Union[timedelta, None]]] = dict()
+        self._malformed: dict[int, set[int]] = dict()  # rows of the cells of each parsed column which are not durations
+        # the parsed ranges the values were fetched from, None when the whole sheet was fetched
+        self.fetched: Union[list[tuple], None] = None
+
+    def __len__(self) -> int:
+        return self.height
+
+    @classmethod
+    def from_columns(cls, columns: list[list[str]], height: int, fetched: list[tuple] = None) -> 'SheetSnapshot':
+        snapshot = cls(list())
+        snapshot.columns, snapshot.height, snapshot.width = columns, height, len(columns)
+        snapshot.fetched = None if fetched is None else [tuple(r) for r in fetched]
+        return snapshot
+
+    @classmethod
+    def from_ranges(cls, ranges: list[str], values: list[list[list[str]]]) -> 'SheetSnapshot':
+        """
+        Builds a snapshot out of the values of some A1 ranges, as `batch_get` returns them.
+        Columns outside of the ranges are left empty.
+        """
+        fetched = [parse_range(address) for address in ranges]
+        height = max((row1 + len(rows) for (row1, _, _, _), rows in zip(fetched, values)), default=0)
+        columns: list[list[str]] = [list() for _ in range(max((col2 + 1 for *_, col2 in fetched), default=0))]
+        for (row1, col1, row2, col2), rows in zip(fetched, values):
+            for col in range(col1, col2 + 1):
+                if len(columns[col]) < height:
+                    columns[col].extend([str()] * (height - len(columns[col])))
+            for idx, row in enumerate(rows):
+                for col, value in zip(range(col1, col2 + 1), row):
+                    columns[col][row1 + idx] = value
+        return cls.from_columns(columns, height, fetched)
+
+    def covers(self, address: str) -> bool:
+        """Whether the cell's value was fetched into this snapshot."""
+        if self.fetched is None:
+            return True
+        row, col = parse_address(address)
+        return any(row1 <= row and (row2 is None or row <= row2) and col1 <= col <= col2
+                   for row1, col1, row2, col2 in self.fetched)
+
+    def dump(self, path: Path, revision: str):
+        """
+        Writes the snapshot as compact, column-wise json tagged with the format version and
+        the revision of the sheet it was fetched at. The file is replaced atomically.
+        """
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': SNAPSHOT_VERSION, 'revision': revision, 'height': self.height,
+                       'fetched': self.fetched, 'columns': self.columns},
+                      file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, revision: str) -> Union['SheetSnapshot', None]:
+        """The snapshot stored at path, if it exists and was fetched at `revision`."""
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                content = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(content, dict) or content.get('version') != SNAPSHOT_VERSION or \
+                content.get('revision') != revision:
+            return None
+        return cls.from_columns(content['columns'], content['height'], content['fetched'])
+
+    @staticmethod
+    def _col(col: Union[str, int]) -> int:
+        return column_index(col) if isinstance(col, str) else col
+
+    def cell(self, address: str) -> str:
+        row, col = parse_address(address)
+        return self.columns[col][row]
+
+    def column(self, col: Union[str, int], trim: bool = False) -> View:
+        """A column by letters or zero-based index. With trim the trailing empty cells are left out."""
+        column = self.columns[self._col(col)]
+        stop = len(column)
+        if trim:
+            while stop and not column[stop - 1]:
+                stop -= 1
+        return View(column, 0, stop)
+
+    def row(self, row: int) -> RowView:
+        """A row by its zero-based index."""
+        if not 0 <= row < self.height:
+            raise IndexError('row index out of range')
+        return RowView(self.columns, row)
+
+    def range(self, address: str) -> list[View]:
+        """The cells of an A1 range as a list of column views."""
+        row1, col1, row2, col2 = parse_range(address)
+        stop = None if row2 is None else row2 + 1
+        return [View(self.columns[col], row1, stop) for col in range(col1, min(col2 + 1, self.width))]
+
+    def durations(self, col: Union[str, int]) -> list[Union[timedelta, None]]:
+        """
+        The column parsed into timedeltas once; empty or malformed cells are None. Headers and
+        labels share the columns with durations, so only `duration` tells malformed cells apart.
+        """
+        col = self._col(col)
+        if col not in self._durations:
+            parsed, malformed = list(), set()
+            for row, cell in enumerate(self.columns[col]):
+                try:
+                    parsed.append(timedelta_from_str(cell) if cell.strip() else None)
+                except (ValueError, IndexError):
+                    parsed.append(None)
+                    malformed.add(row)
+            self._durations[col], self._malformed[col] = parsed, malformed
+        return self._durations[col]
+
+    def duration(self, address: str) -> Union[timedelta, None]:
+        """The duration of a cell, None if it is empty. Raises ValueError if it holds no duration."""
+        row, col = parse_address(address)
+        durations = self.durations(col)
+        if row in self._malformed[col]:
+            raise ValueError(f'cell {address.upper()} holds `{self.columns[col][row]}`, which is not a duration.')
+        return durations[row]
+
+    def rows(self) -> list[list[str]]:
+        """Row-major copy of the values, as returned by `get_all_values`."""
+        return [[column[row] if row < len(column) else str() for column in self.columns]
+                for row in range(self.height)]
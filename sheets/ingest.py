@@ -0,0 +1,63 @@
+"""
+Writing durations into entries. Every (task, date) duration goes out in one bulk upsert, after
+which only the affected tasks and dates get their totals, rollups and progress recomputed.
+"""
+from functools import reduce
+from datetime import date, timedelta
+from django.db import transaction
+from django.db.models import Q
+from sheets import rollup, partitions
+from sheets.models import Sheet, Task, Entry
+
+
+@transaction.atomic
+def upsert_entries(entries: list[Entry], batch_size: int = 1000) -> tuple[int, int]:
+    """
+    Inserts the entries, or updates the duration of the existing ones on the same task and date.
+    Returns the number of created and updated entries.
+    """
+    latest: dict[tuple[int, date], Entry] = {(entry.task_id, entry.date): entry for entry in entries}
+    if not latest:
+        return 0, 0
+
+    task_ids = {task_id for task_id, _ in latest}
+    existing = Entry.objects.filter(task_id__in=task_ids, date__gte=min(dt for _, dt in latest),
+                                    date__lte=max(dt for _, dt in latest)). \
+        values_list('task_id', 'date', 'duration')
+    existing = {(task_id, dt): duration for task_id, dt, duration in existing if (task_id, dt) in latest}
+
+    to_write, deltas = list(), list()
+    for key, entry in latest.items():
+        if key not in existing:
+            deltas.append((entry.task_id, entry.date, entry.duration or timedelta(seconds=0), 1))
+        elif existing[key] != entry.duration:
+            deltas.append((entry.task_id, entry.date,
+                           (entry.duration or timedelta(seconds=0)) - (existing[key] or timedelta(seconds=0)), 0))
+        else:
+            continue
+        entry.progress = None
+        to_write.append(entry)
+    if not to_write:
+        return 0, 0
+
+    partitions.ensure(min(entry.date for entry in to_write), max(entry.date for entry in to_write))
+    Entry.objects.bulk_create(to_write, batch_size=batch_size, update_conflicts=True,
+                              unique_fields=['task', 'date'], update_fields=['duration', 'progress'])
+
+    # the average-to-date, so the progress, of every later entry of a changed task moves as well
+    first_dates: dict[int, date] = dict()
+    for entry in to_write:
+        first_dates[entry.task_id] = min(entry.date, first_dates.get(entry.task_id, entry.date))
+    Entry.objects.filter(reduce(
+        lambda q, kw: q | Q(task_id=kw[0], date__gt=kw[1]), first_dates.items(), Q(pk__in=[])
+    )).update(progress=None)
+
+    dates = {entry.date for entry in to_write}
+    Task.apply_deltas(deltas)
+    Task.ensure_checkpoints(list(first_dates), max(dates))
+    Entry.eval_all_progress(list(first_dates))
+    rollup.update(first_dates, dates)
+    Sheet.touch(Task.objects.filter(id__in=first_dates).values('sheet_id'))
+
+    updated = sum(1 for entry in to_write if (entry.task_id, entry.date) in existing)
+    return len(to_write) - updated, updated
@@ -0,0 +1,78 @@
+import csv
+import json
+
+from pathlib import Path
+from datetime import date
+from argparse import ArgumentParser
+from sheets.ingest import upsert_entries
+from sheets.models import Sheet, Task, Entry
+from sheets.client.script import ProdClient
+from sheets.client.backends import BACKENDS, get_backend
+from utils.datetime import date_from_str
+from utils.string import timedelta_from_str
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Ingests the durations of a range of dates, from dated history columns of the sheet or from a file.'
+
+    def add_arguments(self, parser: ArgumentParser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--columns', help='history columns of the sheet whose first row holds '
+                                              'a date, such as `G:Z`.')
+        source.add_argument('--file', type=Path, help='a .csv with `date,task,duration` columns or a .ndjson '
+                                                      'with objects of those keys, as the export command writes.')
+        parser.add_argument('--from', dest='first_date', help='first date to ingest, YYYY/MM/DD.')
+        parser.add_argument('--to', dest='last_date', help='last date to ingest, YYYY/MM/DD.')
+        parser.add_argument('--gregorian', action='store_true', help='dates are gregorian instead of jalali.')
+        parser.add_argument('--renew-tasks', action='store_true',
+                            help='sync the tasks of the sheet before reading the columns, as the run command '
+                                 'does. tasks the sheet no longer has are archived.')
+        parser.add_argument('-s', '--sheet', default=None, required=False,
+                            help='name of the sheet, the one of settings.SHEET_NAME by default.')
+        parser.add_argument('-b', '--backend', choices=list(BACKENDS), default=None, required=False)
+
+    def read_file(self, path: Path, jalali: bool, sheet: Sheet) -> list[Entry]:
+        path = Path(path)
+        with open(path, 'r', encoding='utf-8') as file:
+            if path.suffix == '.ndjson':
+                rows = [json.loads(line) for line in file if line.strip()]
+            else:
+                rows = list(csv.DictReader(file))
+
+        tasks = {task.name: task for task in Task.objects.filter(sheet=sheet)}
+        entries = list()
+        for row in rows:
+            if row['task'] not in tasks:
+                raise CommandError(f"task `{row['task']}` does not exist.")
+            if not row['duration']:
+                continue
+            entries.append(Entry(task=tasks[row['task']], date=date_from_str(row['date'], jalali),
+                                 duration=timedelta_from_str(row['duration'])))
+        return entries
+
+    def handle(self, *args, **options):
+        jalali = not options['gregorian']
+        first_date: date = options['first_date'] and date_from_str(options['first_date'], jalali)
+        last_date: date = options['last_date'] and date_from_str(options['last_date'], jalali)
+
+        sheet = Sheet.default() if options['sheet'] is None else Sheet.objects.filter(name=options['sheet']).first()
+        if sheet is None:
+            raise CommandError(f"sheet `{options['sheet']}` does not exist.")
+
+        if options['file']:
+            entries = [entry for entry in self.read_file(options['file'], jalali, sheet)
+                       if (not first_date or entry.date >= first_date) and (not last_date or entry.date <= last_date)]
+        else:
+            client = ProdClient(options['backend'] and get_backend(options['backend']), sheet)
+            client.declare_range(options['columns'])
+            client.setup()
+            if options['renew_tasks']:
+                client.renew_tasks()
+            try:
+                entries = client.dated_durations(options['columns'], first_date, last_date, jalali)
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        created, updated = upsert_entries(entries)
+        self.stdout.write(self.style.SUCCESS(f'{created} entries created, {updated} entries updated.'))
@@ -0,0 +1,100 @@
+import io
+import csv
+import json
+
+from pathlib import Path
+from datetime import date
+from itertools import islice
+from argparse import ArgumentParser
+from sheets.models import Sheet, Entry
+from utils import jcalendar
+from utils.datetime import date_from_str
+from utils.string import stringify_timedelta, format_date
+from django.core.management.base import BaseCommand, CommandError
+
+FIELDS = ['date', 'task', 'duration', 'group', 'genre', 'progress']
+
+
+class Command(BaseCommand):
+    help = 'Streams the entries of a sheet with their task fields as .csv or .ndjson, in the format backfill reads.'
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument('-o', '--output', type=Path, default=None,
+                            help='file to write, stdout by default. its suffix picks the format.')
+        parser.add_argument('-f', '--format', choices=['csv', 'ndjson'], default=None,
+                            help='defaults to the suffix of the output, or csv.')
+        parser.add_argument('--from', dest='first_date', help='first date to export, YYYY/MM/DD.')
+        parser.add_argument('--to', dest='last_date', help='last date to export, YYYY/MM/DD.')
+        parser.add_argument('--gregorian', action='store_true', help='dates are gregorian instead of jalali, '
+                                                                   'both in the options and in the output.')
+        parser.add_argument('--group', action='append', help='only the tasks of this group. can be repeated.')
+        parser.add_argument('--genre', action='append', help='only the tasks of this genre. can be repeated.')
+        parser.add_argument('-s', '--sheet', default=None, required=False,
+                            help='name of the sheet, the one of settings.SHEET_NAME by default.')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='rows fetched from the database cursor at a time.')
+
+    @staticmethod
+    def format_dates(dates: list[date], jalali: bool) -> list[str]:
+        """The dates of a chunk formatted at once, instead of a jdatify call per row."""
+        if not jalali:
+            return [format_date(dt) for dt in dates]
+        years, months, days = jcalendar.to_jalali(jcalendar.ordinals(dates))
+        return [f'{y:04d}/{m:02d}/{d:02d}' for y, m, d in zip(years.tolist(), months.tolist(), days.tolist())]
+
+    def chunks(self, query, jalali: bool, chunk_size: int):
+        """Rows of FIELDS, a chunk at a time, off a server-side cursor where the database has one."""
+        rows = query.values_list('date', 'task__name', 'duration', 'task__group', 'task__genre', 'progress'). \
+            iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            dates = self.format_dates([row[0] for row in chunk], jalali)
+            yield [(dt, name, None if duration is None else stringify_timedelta(duration), group, genre,
+                    None if progress is None else int(progress))
+                   for dt, (_, name, duration, group, genre, progress) in zip(dates, chunk)]
+
+    @staticmethod
+    def render(chunk: list[tuple], fmt: str, header: bool) -> str:
+        if fmt == 'ndjson':
+            return ''.join(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n' for row in chunk)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        if header:
+            writer.writerow(FIELDS)
+        writer.writerows(['' if value is None else value for value in row] for row in chunk)
+        return buffer.getvalue()
+
+    def handle(self, *args, **options):
+        jalali = not options['gregorian']
+        output: Path = options['output']
+        fmt = options['format'] or ('ndjson' if output and output.suffix == '.ndjson' else 'csv')
+
+        sheet = Sheet.default() if options['sheet'] is None else Sheet.objects.filter(name=options['sheet']).first()
+        if sheet is None:
+            raise CommandError(f"sheet `{options['sheet']}` does not exist.")
+        query = Entry.objects.filter(task__sheet=sheet)
+        if options['first_date']:
+            query = query.filter(date__gte=date_from_str(options['first_date'], jalali))
+        if options['last_date']:
+            query = query.filter(date__lte=date_from_str(options['last_date'], jalali))
+        if options['group']:
+            query = query.filter(task__group__in=options['group'])
+        if options['genre']:
+            query = query.filter(task__genre__in=options['genre'])
+        query = query.order_by('date', 'task__row')
+
+        file = open(output, 'w', encoding='utf-8', newline='') if output else None
+        count = 0
+        try:
+            write = file.write if file else lambda text: self.stdout.write(text, ending='')
+            if fmt == 'csv':
+                write(self.render([], fmt, header=True))
+            for chunk in self.chunks(query, jalali, options['chunk_size']):
+                write(self.render(chunk, fmt, header=False))
+                count += len(chunk)
+        finally:
+            if file:
+                file.close()
+        self.stderr.write(f'{count} entries exported.')
@@ -0,0 +1,50 @@
+from datetime import date
+from argparse import ArgumentParser
+from django.conf import settings
+from django.db import connection
+from sheets import partitions
+from utils.datetime import date_from_str
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Manages the range partitions of the entries table on PostgreSQL (settings.ENTRY_PARTITIONING).'
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument('--convert', action='store_true',
+                            help='rebuild the entries table as partitioned, or as a plain table if '
+                                 'ENTRY_PARTITIONING is None. locks the table while the rows are copied.')
+        parser.add_argument('--ahead', type=int, default=None,
+                            help='create the partitions of this many periods after the current one, '
+                                 'settings.ENTRY_PARTITIONS_AHEAD by default.')
+        parser.add_argument('--detach-before', help='detach the partitions ending on or before this date, '
+                                                    'YYYY/MM/DD, to archive them.')
+        parser.add_argument('--gregorian', action='store_true', help='the date is gregorian instead of jalali.')
+        parser.add_argument('--list', action='store_true', help='list the partitions.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('partitioning needs PostgreSQL.')
+
+        if options['convert']:
+            partitions.convert(settings.ENTRY_PARTITIONING)
+            state = f'partitioned by {settings.ENTRY_PARTITIONING}' if settings.ENTRY_PARTITIONING else 'a plain table'
+            self.stdout.write(self.style.SUCCESS(f'The entries table is {state}.'))
+
+        if not partitions.is_partitioned():
+            if settings.ENTRY_PARTITIONING:
+                raise CommandError('the entries table is not partitioned yet; run with --convert.')
+            return
+
+        created = partitions.create_ahead(options['ahead'])
+        if created:
+            self.stdout.write(f'Created {", ".join(created)}.')
+
+        if options['detach_before']:
+            before: date = date_from_str(options['detach_before'], not options['gregorian'])
+            detached = partitions.detach(before)
+            self.stdout.write(f'Detached {", ".join(detached) or "nothing"}; dump and drop the tables to archive them.')
+
+        if options['list']:
+            for name, (start, end) in sorted(partitions.partitions().items(), key=lambda kv: kv[1]):
+                self.stdout.write(f'{name}: {start} - {end}')
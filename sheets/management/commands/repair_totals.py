@@ -0,0 +1,10 @@
+from sheets.models import Task
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the tasks' running totals and checkpoints from their entries."
+
+    def handle(self, *args, **options):
+        Task.rebuild_totals()
+        self.stdout.write(self.style.SUCCESS('Successful!'))
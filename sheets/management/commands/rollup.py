@@ -0,0 +1,25 @@
+from argparse import ArgumentParser
+from sheets import rollup
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or checks the AvgStat, WeeklyStat and MonthlyStat rollups.'
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument('--rebuild', action='store_true', help='recompute every rollup row from scratch.')
+        parser.add_argument('--check', action='store_true',
+                            help='compare the stored rollups with a from-scratch recompute.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rollup.rebuild()
+            self.stdout.write(self.style.SUCCESS('Rebuilt the rollups.'))
+
+        if options['check']:
+            mismatches = rollup.check()
+            for mismatch in mismatches:
+                self.stdout.write(mismatch)
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} rollup rows are inconsistent.')
+            self.stdout.write(self.style.SUCCESS('The rollups are consistent.'))
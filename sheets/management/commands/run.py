@@ -1,6 +1,26 @@
+import json
+import pstats
+import cProfile
+import textwrap
+import threading
+import traceback
+import tracemalloc
+
+from pathlib import Path
+from queue import Queue, Empty
 from argparse import ArgumentParser
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from sheets import partitions
+from sheets.models import Sheet
+from sheets.metrics import Recorder
+from sheets.analytics import Entries
+from sheets.pipeline import Pipeline, Stage
 from sheets.client.script import ProdClient
-from django.core.management.base import BaseCommand
+from sheets.client.scheduler import ScheduledBackend
+from sheets.client.backends import BACKENDS, get_backend
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
@@ -16,12 +36,184 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser: ArgumentParser):
         parser.add_argument('-t', '--today', type=self.bool, default="True", required=False)
+        parser.add_argument('-c', '--cache', type=self.bool, default="True", required=False,
+                            help='reuse the local snapshot of the sheet if the sheet has not changed since.')
+        parser.add_argument('-r', '--renames', type=self.bool, default=settings.DETECT_TASK_RENAMES, required=False,
+                            help='take a new task on the row of a missing task of the same group and genre '
+                                 'as that task renamed, keeping its entries.')
+        parser.add_argument('-s', '--sheet', default=None, required=False,
+                            help='name of the sheet to sync, the one of settings.SHEET_NAME by default.')
+        parser.add_argument('--all', action='store_true', help='sync every active sheet.')
+        parser.add_argument('--workers', type=int, default=settings.SHEETS_WORKERS,
+                            help='sheets synced at the same time with --all.')
+        parser.add_argument('-b', '--backend', choices=list(BACKENDS), default=None, required=False,
+                            help="overrides the sheet's backend with the one of its settings.")
+        parser.add_argument('--concurrent', type=self.bool, default="True", required=False,
+                            help='run independent stages at the same time. off with --all, whose '
+                                 'parallelism is across sheets.')
+        parser.add_argument('--timings', action='store_true',
+                            help='report the time of each stage and the wall-clock time saved.')
+        parser.add_argument('--metrics', nargs='?', const='data/metrics.jsonl', default=None,
+                            help='append the queries and sheet API calls of each stage as JSON lines '
+                                 'to this file, data/metrics.jsonl by default, or `-` for stdout.')
+        parser.add_argument('--profile', action='store_true',
+                            help='profile the run with cProfile into data/. runs the stages one by one.')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='trace allocations with tracemalloc and write the top ones into data/.')
+        parser.add_argument('--analytics', action='store_true',
+                            help='write the averages, buckets and streaks of the entries into data/.')
+
+    def build(self, sheet: Sheet, options: dict, recorder: Recorder = None) -> tuple[ProdClient, Pipeline]:
+        backend = sheet.get_backend() if options['backend'] is None else get_backend(options['backend'])
+        client = ProdClient(recorder.instrument(backend) if recorder else backend, sheet)
+        stages = [
+            Stage('setup', lambda: client.setup(options['cache'])),
+            Stage('renew_tasks', lambda: client.renew_tasks(options['renames']), deps=['setup']),
+            Stage('create_partitions', partitions.create_ahead),
+            Stage('create_entries', lambda: client.create_entries(options['today']),
+                  deps=['renew_tasks', 'create_partitions']),
+            Stage('update_average_cells', client.update_average_cells, deps=['create_entries']),
+            Stage('flush_average_cells', client.flush, deps=['update_average_cells']),
+            Stage('eval_average_spent_time', client.eval_average_spent_time, deps=['create_entries']),
+            Stage('flush', client.flush, deps=['flush_average_cells', 'eval_average_spent_time']),
+        ]
+        if options['analytics']:
+            stages.append(Stage('analytics', lambda: self.write_analytics(sheet), deps=['create_entries']))
+        return client, Pipeline(stages, recorder=recorder)
+
+    def report(self, client: ProdClient, pipeline: Pipeline, options: dict) -> list[str]:
+        lines = [str(client.task_changes), client.buffer.report()]
+        if isinstance(client.backend, ScheduledBackend):
+            lines.append(client.backend.report())
+        if options['timings']:
+            lines.append(pipeline.report())
+        return lines
+
+    def write_metrics(self, recorder: Recorder, client: ProdClient, options: dict):
+        if isinstance(client.backend, ScheduledBackend):
+            recorder.note('scheduler', client.backend.stats())
+        if options['metrics'] == '-':
+            self.stdout.write('\n'.join(recorder.lines()))
+        else:
+            recorder.write(settings.BASE_DIR / options['metrics'])
 
     def handle(self, *args, **options):
-        client = ProdClient()
-        client.setup()
-        client.renew_tasks()
-        client.create_entries(options['today'])
-        client.update_average_cells()
-        client.eval_average_spent_time()
+        if options['all']:
+            return self.handle_all(options)
+
+        sheet = Sheet.default() if options['sheet'] is None else Sheet.objects.filter(name=options['sheet']).first()
+        if sheet is None:
+            raise CommandError(f"sheet `{options['sheet']}` does not exist.")
+        recorder = Recorder(sheet=sheet.name) if options['metrics'] else None
+        client, pipeline = self.build(sheet, options, recorder)
+
+        stamp = timezone.localtime().strftime('%Y%m%d-%H%M%S')
+        if options['trace_memory']:
+            tracemalloc.start()
+        profiler = cProfile.Profile() if options['profile'] else None
+        try:
+            if profiler:  # cProfile only sees the thread it is enabled on
+                profiler.runcall(pipeline.run, concurrent=False)
+            else:
+                pipeline.run(concurrent=options['concurrent'])
+        finally:  # the reports of a failed run are the ones most worth keeping
+            if recorder:
+                self.write_metrics(recorder, client, options)
+            if options['trace_memory']:
+                try:
+                    self.write_memory(tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1], stamp)
+                finally:
+                    tracemalloc.stop()
+            if profiler:
+                self.write_profile(profiler, stamp)
+
+        for line in self.report(client, pipeline, options):
+            self.stdout.write(line)
         self.stdout.write(self.style.SUCCESS('Successful!'))
+
+    def handle_all(self, options: dict):
+        """
+        Syncs the active sheets on a bounded pool of worker threads. Each worker keeps its own
+        database connection for every sheet it takes, and a failing sheet is reported at the
+        end without stopping the others.
+        """
+        if options['profile'] or options['trace_memory'] or options['sheet'] or options['backend']:
+            raise CommandError('--profile, --trace-memory, --sheet and --backend apply to a single sheet.')
+
+        sheets: Queue = Queue()
+        for sheet in Sheet.objects.filter(active=True).order_by('name'):
+            sheets.put(sheet)
+        total = sheets.qsize()
+        reports: dict[str, list[str]] = dict()
+        failures: dict[str, str] = dict()
+        lock = threading.Lock()
+
+        def sync(sheet: Sheet):
+            recorder = Recorder(sheet=sheet.name) if options['metrics'] else None
+            client, pipeline = self.build(sheet, options, recorder)
+            try:
+                pipeline.run(concurrent=False)
+            finally:
+                if recorder:
+                    with lock:
+                        self.write_metrics(recorder, client, options)
+            return self.report(client, pipeline, options)
+
+        def work():
+            try:
+                while True:
+                    try:
+                        sheet = sheets.get_nowait()
+                    except Empty:
+                        return
+                    try:
+                        lines = sync(sheet)
+                        with lock:
+                            reports[sheet.name] = lines
+                    except Exception:
+                        with lock:
+                            failures[sheet.name] = traceback.format_exc()
+                        for connection in connections.all():  # a broken connection would fail the next sheet
+                            connection.close_if_unusable_or_obsolete()
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=work, name=f'sync-{idx}') for idx in range(min(options['workers'], total))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        for name in sorted(reports):
+            self.stdout.write(f'{name}:')
+            for line in reports[name]:
+                self.stdout.write(textwrap.indent(line, '  '))
+        for name in sorted(failures):
+            self.stderr.write(f'{name} failed:\n{failures[name]}')
+        if failures:
+            raise CommandError(f'{len(failures)} of {total} sheets failed: {", ".join(sorted(failures))}.')
+        self.stdout.write(self.style.SUCCESS(f'Synced {total} sheets.'))
+
+    def write_profile(self, profiler: cProfile.Profile, stamp: str):
+        path: Path = settings.BASE_DIR / 'data' / f'profile-{stamp}.prof'
+        path.parent.mkdir(exist_ok=True)
+        profiler.dump_stats(path)
+        with open(path.with_suffix('.txt'), 'w') as file:
+            pstats.Stats(profiler, stream=file).sort_stats('cumulative').print_stats(50)
+        self.stdout.write(f'profile written to {path}')
+
+    def write_analytics(self, sheet: Sheet):
+        path: Path = settings.BASE_DIR / 'data' / f'analytics-{sheet.pk}.json'
+        path.parent.mkdir(exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(Entries.load(sheet).summary(), file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'analytics written to {path}')
+
+    def write_memory(self, snapshot: tracemalloc.Snapshot, peak: int, stamp: str):
+        path: Path = settings.BASE_DIR / 'data' / f'memory-{stamp}.txt'
+        path.parent.mkdir(exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(f'peak {peak / 1024:.1f} KiB\n')
+            for stat in snapshot.statistics('lineno')[:30]:
+                file.write(f'{stat}\n')
+        self.stdout.write(f'memory report written to {path}')
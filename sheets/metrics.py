@@ -0,0 +1,139 @@
+"""
+Per-stage instrumentation of a run: the count and time of the sheet API calls and SQL queries
+each stage makes, written out as JSON lines. Nothing here is hooked in unless a `Recorder`
+is passed to the pipeline and the backend is wrapped with `Recorder.instrument`.
+"""
+import json
+import time
+import threading
+import tracemalloc
+
+from pathlib import Path
+from contextlib import contextmanager, ExitStack
+from django.db import connections
+from django.utils import timezone
+from sheets.client.backends import SheetBackend
+
+
+class StageMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.api_calls = 0
+        self.api_seconds = 0.0
+        self.memory_peak = None
+        self.error = None
+
+    def as_dict(self) -> dict:
+        data = {
+            'stage': self.name, 'seconds': round(self.seconds, 4),
+            'queries': self.queries, 'query_seconds': round(self.query_seconds, 4),
+            'api_calls': self.api_calls, 'api_seconds': round(self.api_seconds, 4),
+            'python_seconds': round(max(self.seconds - self.query_seconds - self.api_seconds, 0), 4),
+        }
+        if self.memory_peak is not None:
+            data['memory_peak'] = self.memory_peak
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class InstrumentedBackend(SheetBackend):
+    """Delegates to a backend, counting and timing each call against the running stage."""
+
+    def __init__(self, backend: SheetBackend, recorder: 'Recorder'):
+        self.backend = backend
+        self.recorder = recorder
+        self.quota = backend.quota
+
+    def _call(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            metrics = self.recorder.current
+            if metrics is not None:
+                metrics.api_calls += 1
+                metrics.api_seconds += time.perf_counter() - start
+
+    def open(self):
+        return self._call(self.backend.open)
+
+    @property
+    def revision(self) -> str:
+        return self.backend.revision
+
+    def get_all_values(self) -> list[list[str]]:
+        return self._call(self.backend.get_all_values)
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        return self._call(self.backend.batch_get, ranges)
+
+    def batch_update(self, data: list[dict]):
+        return self._call(self.backend.batch_update, data)
+
+
+class Recorder:
+    def __init__(self, **tags):
+        self.tags = tags  # added to every line, such as the sheet's name
+        self.stages: dict[str, StageMetrics] = dict()
+        self.notes: dict[str, dict] = dict()  # run wide figures, such as those of the scheduler
+        self.local = threading.local()  # stages may run on different threads at once
+
+    @property
+    def current(self) -> StageMetrics:
+        return getattr(self.local, 'metrics', None)
+
+    def instrument(self, backend: SheetBackend) -> InstrumentedBackend:
+        return InstrumentedBackend(backend, self)
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics = self.current
+            if metrics is not None:
+                metrics.queries += 1
+                metrics.query_seconds += time.perf_counter() - start
+
+    @contextmanager
+    def stage(self, name: str):
+        metrics = self.stages[name] = StageMetrics(name)
+        self.local.metrics = metrics
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()  # process wide, so peaks of concurrent stages overlap
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(self._execute_wrapper))
+                yield metrics
+        except Exception as e:
+            metrics.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            metrics.seconds = time.perf_counter() - start
+            if tracemalloc.is_tracing():
+                metrics.memory_peak = tracemalloc.get_traced_memory()[1]
+            self.local.metrics = None
+
+    def note(self, name: str, data: dict):
+        self.notes[name] = data
+
+    def lines(self) -> list[str]:
+        """One JSON object per stage, one per note and a last one summing the stages up."""
+        run_at = timezone.localtime().isoformat(timespec='seconds')
+        lines = [json.dumps({'run': run_at, **self.tags, **metrics.as_dict()}) for metrics in self.stages.values()]
+        lines.extend(json.dumps({'run': run_at, **self.tags, 'note': name, **data}) for name, data in self.notes.items())
+        total = {key: round(sum(getattr(metrics, key) for metrics in self.stages.values()), 4)
+                 for key in ('seconds', 'queries', 'query_seconds', 'api_calls', 'api_seconds')}
+        lines.append(json.dumps({'run': run_at, **self.tags, 'stage': 'total', **total}))
+        return lines
+
+    def write(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a') as file:
+            file.write('\n'.join(self.lines()) + '\n')
@@ -0,0 +1,30 @@
+# Generated by Django 4.0 on 2026-10-17 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sheets', '0008_alter_entry_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarDay',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('jyear', models.PositiveSmallIntegerField()),
+                ('jmonth', models.PositiveSmallIntegerField()),
+                ('jday', models.PositiveSmallIntegerField()),
+                ('week_start', models.DateField(db_index=True)),
+                ('month_start', models.DateField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='day',
+            field=models.ForeignObject(from_fields=('date',), on_delete=django.db.models.deletion.DO_NOTHING, related_name='entries', to='sheets.calendarday', to_fields=('date',)),
+        ),
+    ]
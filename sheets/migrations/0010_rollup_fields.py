@@ -0,0 +1,62 @@
+# Generated by Django 4.0 on 2026-10-17 11:40
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sheets', '0009_calendarday_entry_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlystat',
+            name='days',
+            field=models.PositiveSmallIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='monthlystat',
+            name='group',
+            field=models.CharField(default='', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='monthlystat',
+            name='total',
+            field=models.DurationField(default=datetime.timedelta(0)),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='weeklystat',
+            name='days',
+            field=models.PositiveSmallIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='weeklystat',
+            name='group',
+            field=models.CharField(default='', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='weeklystat',
+            name='total',
+            field=models.DurationField(default=datetime.timedelta(0)),
+            preserve_default=False,
+        ),
+        migrations.AlterUniqueTogether(
+            name='avgstat',
+            unique_together={('task', 'tipe')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlystat',
+            unique_together={('group', 'start_date')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='weeklystat',
+            unique_together={('group', 'start_date')},
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.0 on 2026-10-17 13:05
+
+import datetime
+from django.db import migrations, models
+from django.db.models import Sum, Count
+import django.db.models.deletion
+
+
+def populate_totals(apps, schema_editor):
+    Task = apps.get_model('sheets', 'Task')
+    Entry = apps.get_model('sheets', 'Entry')
+    totals = Entry.objects.values('task_id').order_by().annotate(sum=Sum('duration'), count=Count('id'))
+    for kw in totals:
+        Task.objects.filter(id=kw['task_id']).update(
+            duration_sum=kw['sum'] or datetime.timedelta(0), entry_count=kw['count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sheets', '0010_rollup_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='duration_sum',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='entry_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TaskCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('duration_sum', models.DurationField()),
+                ('entry_count', models.PositiveIntegerField()),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='sheets.task')),
+            ],
+            options={
+                'unique_together': {('task', 'date')},
+            },
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
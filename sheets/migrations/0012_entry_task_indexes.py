@@ -0,0 +1,26 @@
+# Generated by Django 4.1.13 on 2026-10-17 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sheets', '0011_task_totals_taskcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['group'], name='task_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['date'], name='entry_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(condition=models.Q(('duration__isnull', False), ('progress__isnull', True)),
+                               fields=['task'], name='entry_pending_progress_idx'),
+        ),
+    ]
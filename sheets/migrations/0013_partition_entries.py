@@ -0,0 +1,95 @@
+# Generated by Django 4.1.13 on 2026-10-17 21:00
+
+from datetime import date
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+from utils import jcalendar
+
+# A frozen copy of sheets.partitions.convert as of this migration, so that later changes to
+# that module or to the Entry model do not change what this migration does.
+PERIODS = {'year': 12, 'quarter': 3}  # jalali months per partition
+
+
+def partition_bounds(table: str, dt: date, period: str) -> tuple[str, date, date]:
+    """Name, first day and the day after the last day of the partition holding dt."""
+    months = PERIODS[period]
+    idx = int(jcalendar.month_index(dt.toordinal()))
+    idx -= idx % months
+    starts = jcalendar.month_starts()
+    year = jcalendar.FIRST_YEAR + idx // 12
+    name = f'{table}_{year}' if period == 'year' else f'{table}_{year}q{idx % 12 // 3 + 1}'
+    return name, date.fromordinal(int(starts[idx])), date.fromordinal(int(starts[idx + months]))
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    cursor.execute('SELECT EXISTS(SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)', [table])
+    return cursor.fetchone()[0]
+
+
+def convert(apps, schema_editor, period):
+    """Rebuilds the entries table as partitioned by `period`, or as a plain table for None."""
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    name = apps.get_model('sheets', 'Entry')._meta.db_table
+    old = f'{name}_old'
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor, name) == bool(period):
+            return
+        cursor.execute('SELECT count(*) FROM pg_constraint WHERE confrelid = %s::regclass', [name])
+        if cursor.fetchone()[0]:
+            raise ValueError(f'foreign keys reference `{name}`; they must be dropped before it is rebuilt.')
+        cursor.execute("SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f', 'c')", [name])
+        constraints = cursor.fetchall()
+        cursor.execute('SELECT i.relname, pg_get_indexdef(x.indexrelid) FROM pg_index x '
+                       'JOIN pg_class i ON i.oid = x.indexrelid WHERE x.indrelid = %s::regclass '
+                       'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)', [name])
+        indexes = cursor.fetchall()
+        cursor.execute(f'SELECT min(date), max(date), coalesce(max(id), 0) FROM "{name}"')
+        first, last, max_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE "{name}" RENAME TO "{old}"')
+        # defaults are left behind: the id sequence belongs to the old table
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{old}")' + (' PARTITION BY RANGE (date)' if period else ''))
+        if period:
+            today = timezone.localdate()
+            dt, end = min(first or today, today), max(last or today, today)
+            for _ in range(settings.ENTRY_PARTITIONS_AHEAD):
+                end = partition_bounds(name, end, period)[2]
+            while dt <= end:
+                partition, start, dt = partition_bounds(name, dt, period)
+                cursor.execute(f'CREATE TABLE "{partition}" PARTITION OF "{name}" FOR VALUES FROM (%s) TO (%s)',
+                               [start, dt])
+        cursor.execute(f'INSERT INTO "{name}" SELECT * FROM "{old}"')
+        cursor.execute(f'DROP TABLE "{old}"')
+
+        cursor.execute(f'CREATE SEQUENCE "{name}_id_seq" START WITH {max_id + 1} OWNED BY "{name}".id')
+        cursor.execute(f'ALTER TABLE "{name}" ALTER COLUMN id SET DEFAULT nextval(\'"{name}_id_seq"\')')
+        for constraint, kind, definition in constraints:
+            if kind == 'p':
+                definition = 'PRIMARY KEY (id, date)' if period else 'PRIMARY KEY (id)'
+            cursor.execute(f'ALTER TABLE "{name}" ADD CONSTRAINT "{constraint}" {definition}')
+        for _, definition in indexes:
+            cursor.execute(definition)
+
+
+def partition_entries(apps, schema_editor):
+    if settings.ENTRY_PARTITIONING:
+        convert(apps, schema_editor, settings.ENTRY_PARTITIONING)
+
+
+def unpartition_entries(apps, schema_editor):
+    convert(apps, schema_editor, None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sheets', '0012_entry_task_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_entries, unpartition_entries),
+    ]
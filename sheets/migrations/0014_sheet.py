@@ -0,0 +1,58 @@
+# Generated by Django 4.1.13 on 2026-10-17 21:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def assign_default_sheet(apps, schema_editor):
+    """
+    The tasks and stats so far belong to the single sheet of settings.SHEET_NAME. The columns are
+    made non-null in the next migration, since postgres refuses to alter a table while the
+    deferred foreign key checks of these updates are pending in the same transaction.
+    """
+    Sheet = apps.get_model('sheets', 'Sheet')
+    models_ = [apps.get_model('sheets', name) for name in ('Task', 'WeeklyStat', 'MonthlyStat')]
+    if not any(model.objects.exists() for model in models_):
+        return
+    sheet, _ = Sheet.objects.get_or_create(name=settings.SHEET_NAME, defaults={'backend': settings.SHEET_BACKEND})
+    for model in models_:
+        model.objects.update(sheet=sheet)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sheets', '0013_partition_entries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sheet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('backend', models.CharField(choices=[('google', 'google'), ('xlsx', 'xlsx')], default='google',
+                                             max_length=20)),
+                ('location', models.CharField(blank=True, max_length=500)),
+                ('active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='sheet',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tasks',
+                                    to='sheets.sheet'),
+        ),
+        migrations.AddField(
+            model_name='weeklystat',
+            name='sheet',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='sheets.sheet'),
+        ),
+        migrations.AddField(
+            model_name='monthlystat',
+            name='sheet',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='sheets.sheet'),
+        ),
+        migrations.RunPython(assign_default_sheet, migrations.RunPython.noop),
+    ]
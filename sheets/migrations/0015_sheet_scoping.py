@@ -0,0 +1,55 @@
+# Generated by Django 4.1.13 on 2026-10-17 21:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sheets', '0014_sheet'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='sheet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks',
+                                    to='sheets.sheet'),
+        ),
+        migrations.AlterField(
+            model_name='weeklystat',
+            name='sheet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sheets.sheet'),
+        ),
+        migrations.AlterField(
+            model_name='monthlystat',
+            name='sheet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sheets.sheet'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='name',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterUniqueTogether(
+            name='task',
+            unique_together={('sheet', 'name')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='weeklystat',
+            unique_together={('sheet', 'group', 'start_date')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlystat',
+            unique_together={('sheet', 'group', 'start_date')},
+        ),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_group_idx',
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['sheet', 'group'], name='task_sheet_group_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-17 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sheets', '0015_sheet_scoping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sheet',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
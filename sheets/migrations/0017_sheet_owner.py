@@ -0,0 +1,22 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sheets', '0016_sheet_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sheet',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                    related_name='sheets', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,23 +1,96 @@
 import calendar
-import jdatetime
+import numpy as np
 
-from django.db import models
+from django.db import models, transaction
+from django.conf import settings
 from datetime import timedelta, date
-from django.db.models import Sum, Count, Q, QuerySet
+from typing import Iterable
+from django.utils import timezone
+from django.db.models import Sum, Count, Q, QuerySet, Min, Max, F, Case, When, Value, Window, ValueRange
+from django.db.models.signals import post_delete
 from django.core.validators import MinValueValidator, MaxValueValidator
 from utils.datetime import last_week_day, next_week_day, last_day_of_month, jdatify
+from utils import jcalendar
 from utils.string import stringify_timedelta, format_date, \
     format_week, format_month
 
 PERCENTAGE_VALIDATOR = [MinValueValidator(0), MaxValueValidator(100)]
 
 
-class Task(models.Model):
+class DayNumber(models.Func):
+    """Days since 1970/01/01 of a date, an integer that `RANGE n PRECEDING` frames can offset."""
+    template = "(%(expressions)s - DATE '1970-01-01')"
+    output_field = models.IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) - 2440587.5 AS INTEGER)',
+                           **extra_context)
+
+
+class DayRange(ValueRange):
+    """
+    `RANGE BETWEEN n PRECEDING AND ...` over a `DayNumber`. Django 4.1 refuses offsets in RANGE
+    frames on PostgreSQL, which has run them since version 11, so the frame is rendered as for ROWS.
+    """
+
+    def window_frame_start_end(self, connection, start, end):
+        return connection.ops.window_frame_rows_start_end(start, end)
+
+
+class Sheet(models.Model):
+    """A tracked sheet, one per person. Its tasks, entries and stats are kept apart from other sheets'."""
     name = models.CharField(max_length=200, unique=True)
+    backend = models.CharField(max_length=20, choices=[('google', 'google'), ('xlsx', 'xlsx')], default='google')
+    # the google sheet's name or the .xlsx file's path; the backend's setting when blank
+    location = models.CharField(max_length=500, blank=True)
+    active = models.BooleanField(default=True)
+    revision = models.PositiveIntegerField(default=0)  # bumped whenever its tasks or entries change
+    # the user whom the stats API serves the sheet to; sheets without one are served to superusers only
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='sheets')
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return str(self)
+
+    @classmethod
+    def default(cls) -> 'Sheet':
+        """The sheet of settings.SHEET_NAME, which a single-person deployment tracks."""
+        sheet, _ = cls.objects.get_or_create(name=settings.SHEET_NAME, defaults={'backend': settings.SHEET_BACKEND})
+        return sheet
+
+    @classmethod
+    def touch(cls, sheet_ids):
+        """Bumps the revision of the sheets, which the stats API keys its cache and ETags on."""
+        cls.objects.filter(id__in=sheet_ids).update(revision=F('revision') + 1)
+
+    @classmethod
+    def visible_to(cls, user) -> QuerySet:
+        """The sheets the user may read: every sheet for a superuser, the user's own otherwise."""
+        return cls.objects.all() if user.is_superuser else cls.objects.filter(owner=user)
+
+    def get_backend(self):
+        from sheets.client.backends import BACKENDS
+        return BACKENDS[self.backend](self.location or None)
+
+
+class Task(models.Model):
+    sheet = models.ForeignKey(Sheet, on_delete=models.CASCADE, related_name='tasks')
+    name = models.CharField(max_length=200)
     row = models.PositiveSmallIntegerField()
     archived = models.BooleanField(default=False)
     group = models.CharField(max_length=20)
     genre = models.CharField(max_length=30)
+    duration_sum = models.DurationField(default=timedelta(seconds=0))
+    entry_count = models.PositiveIntegerField(default=0)
+
+    MAX_DELTA_DATES = 500  # beyond this many (task, date) deltas the totals are rebuilt instead
+
+    class Meta:
+        unique_together = ('sheet', 'name')
+        indexes = [models.Index(fields=['sheet', 'group'], name='task_sheet_group_idx')]
 
     def __str__(self):
         archived = ' {archived}' if self.archived else str()
@@ -27,16 +100,218 @@ class Task(models.Model):
         return str(self)
 
     def average(self, max_date: date = None) -> timedelta:
-        query = self.entries.all() if max_date is None else self.entries.filter(date__lte=max_date)
-        s = query.aggregate(sum=Sum('duration'))['sum']
+        """
+        Uses the maintained running totals. For a max_date the totals are taken from the
+        latest checkpoint at or before it and only the entries after the checkpoint are summed.
+        """
+        if max_date is None:
+            s, count = self.duration_sum, self.entry_count
+        else:
+            query = self.entries.filter(date__lte=max_date)
+            checkpoint = self.checkpoints.filter(date__lte=max_date).order_by('-date').first()
+            s, count = timedelta(seconds=0), 0
+            if checkpoint is not None:
+                s, count = checkpoint.duration_sum, checkpoint.entry_count
+                query = query.filter(date__gte=checkpoint.date)
+            rest = query.aggregate(sum=Sum('duration'), count=Count('id'))
+            s, count = s + (rest['sum'] or timedelta(seconds=0)), count + rest['count']
+
         if not s:
             return timedelta(seconds=0)
         else:
-            return s / query.count()
+            return s / count
+
+    @classmethod
+    def trailing_averages(cls, windows: Iterable[int], tasks: QuerySet = None,
+                          as_of: date = None) -> dict[int, dict[int, timedelta]]:
+        """
+        The averages of the tasks over the trailing `windows`, in days through as_of (today by
+        default), by task id and window. One grouped query for every window, which returns a
+        row per task with the sum and count of each window.
+        """
+        as_of, windows = as_of or timezone.localdate(), list(windows)
+        if not windows:
+            return dict()
+        tasks = cls.objects.all() if tasks is None else tasks
+        query = Entry.objects.filter(task__in=tasks, date__gt=as_of - timedelta(days=max(windows)), date__lte=as_of)
+        aggregates = dict()
+        for window in windows:
+            in_window = Q(date__gt=as_of - timedelta(days=window))
+            aggregates[f'sum_{window}'] = Sum('duration', filter=in_window)
+            aggregates[f'count_{window}'] = Count('id', filter=in_window)
+        return {
+            kw['task_id']: {window: (kw[f'sum_{window}'] or timedelta(seconds=0)) / kw[f'count_{window}']
+                            for window in windows if kw[f'count_{window}']}
+            for kw in query.values('task_id').order_by().annotate(**aggregates)
+        }
+
+    @classmethod
+    def apply_deltas(cls, deltas: list[tuple[int, date, timedelta, int]]):
+        """
+        Adds (task_id, date, duration, count) deltas to the running totals of the tasks and
+        to their checkpoints after date, in one UPDATE for each table.
+        """
+        per_task: dict[int, dict[date, list]] = dict()
+        for task_id, dt, duration, count in deltas:
+            if duration or count:
+                per_date = per_task.setdefault(task_id, dict())
+                per_date.setdefault(dt, [timedelta(seconds=0), 0])
+                per_date[dt][0] += duration
+                per_date[dt][1] += count
+        if not per_task:
+            return
+        if sum(map(len, per_task.values())) > cls.MAX_DELTA_DATES:
+            cls.rebuild_totals(list(per_task))
+            return
+
+        task_whens = {'duration_sum': list(), 'entry_count': list()}
+        checkpoint_whens = {'duration_sum': list(), 'entry_count': list()}
+        for task_id, per_date in per_task.items():
+            duration, count = timedelta(seconds=0), 0
+            cumulative = list()
+            for dt in sorted(per_date):
+                duration, count = duration + per_date[dt][0], count + per_date[dt][1]
+                cumulative.append((dt, duration, count))
+            task_whens['duration_sum'].append(When(id=task_id, then=Value(duration)))
+            task_whens['entry_count'].append(When(id=task_id, then=Value(count)))
+            # a checkpoint after several delta dates takes the cumulative delta of the latest one
+            for dt, duration, count in reversed(cumulative):
+                checkpoint_whens['duration_sum'].append(When(task_id=task_id, date__gt=dt, then=Value(duration)))
+                checkpoint_whens['entry_count'].append(When(task_id=task_id, date__gt=dt, then=Value(count)))
+
+        def increments(whens: dict[str, list]) -> dict:
+            return {
+                'duration_sum': F('duration_sum') + Case(*whens['duration_sum'], default=Value(timedelta(seconds=0)),
+                                                         output_field=models.DurationField()),
+                'entry_count': F('entry_count') + Case(*whens['entry_count'], default=Value(0),
+                                                       output_field=models.IntegerField())
+            }
+
+        cls.objects.filter(id__in=per_task).update(**increments(task_whens))
+        TaskCheckpoint.objects.filter(task_id__in=per_task).update(**increments(checkpoint_whens))
+
+    @classmethod
+    def ensure_checkpoints(cls, task_ids: list[int], dt: date):
+        """Creates the missing checkpoints of the tasks at the start of the jalali month of dt."""
+        month_start = date.fromordinal(int(jcalendar.month_start(dt.toordinal())))
+        existing = TaskCheckpoint.objects.filter(task_id__in=task_ids, date=month_start).values_list('task_id', flat=True)
+        missing = set(task_ids) - set(existing)
+        if not missing:
+            return
+
+        later = Entry.objects.filter(task_id__in=missing, date__gte=month_start).values('task_id').order_by(). \
+            annotate(sum=Sum('duration'), count=Count('id'))
+        later = {kw['task_id']: (kw['sum'] or timedelta(seconds=0), kw['count']) for kw in later}
+        TaskCheckpoint.objects.bulk_create([
+            TaskCheckpoint(task=task, date=month_start,
+                           duration_sum=task.duration_sum - later.get(task.id, (timedelta(seconds=0), 0))[0],
+                           entry_count=task.entry_count - later.get(task.id, (timedelta(seconds=0), 0))[1])
+            for task in cls.objects.filter(id__in=missing)
+        ], ignore_conflicts=True)
+
+    @classmethod
+    def rebuild_totals(cls, task_ids: list[int] = None):
+        """
+        Recomputes the running totals from the entries, and a checkpoint at the start of every
+        jalali month in which a task has entries.
+        """
+        tasks = cls.objects.all() if task_ids is None else cls.objects.filter(id__in=task_ids)
+        entries = Entry.objects.filter(task__in=tasks).order_by('task_id', 'date'). \
+            values_list('task_id', 'date', 'duration')
+
+        entries = list(entries)
+        months = jcalendar.month_index([dt.toordinal() for _, dt, _ in entries]).tolist()
+
+        totals: dict[int, list] = dict()
+        checkpoints = list()
+        last_month = None
+        for (task_id, dt, duration), month in zip(entries, months):
+            if task_id not in totals:
+                totals[task_id] = [timedelta(seconds=0), 0]
+                last_month = None
+            if month != last_month:
+                month_start = date.fromordinal(int(jcalendar.month_starts()[month]))
+                checkpoints.append(TaskCheckpoint(task_id=task_id, date=month_start,
+                                                  duration_sum=totals[task_id][0], entry_count=totals[task_id][1]))
+                last_month = month
+            totals[task_id][0] += duration or timedelta(seconds=0)
+            totals[task_id][1] += 1
+
+        tasks = list(tasks)
+        for task in tasks:
+            task.duration_sum, task.entry_count = totals.get(task.id, (timedelta(seconds=0), 0))
+        cls.objects.bulk_update(tasks, ['duration_sum', 'entry_count'], batch_size=1000)
+        TaskCheckpoint.objects.filter(task__in=tasks).delete()
+        TaskCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+
+
+class TaskCheckpoint(models.Model):
+    """Running totals of a task's entries dated before `date`."""
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='checkpoints')
+    date = models.DateField()
+    duration_sum = models.DurationField()
+    entry_count = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('task', 'date')
+
+    def __str__(self):
+        return f'{self.task}:{format_date(jdatify(self.date))} {stringify_timedelta(self.duration_sum)}/{self.entry_count}'
+
+    def __repr__(self):
+        return str(self)
+
+
+class CalendarDay(models.Model):
+    """
+    Date dimension table. Maps each gregorian date to its jalali date, the saturday which
+    starts its week and the gregorian date on which its jalali month starts, so entries can
+    be bucketed with a join instead of walking the calendar in python.
+    """
+    date = models.DateField(primary_key=True)
+    jyear = models.PositiveSmallIntegerField()
+    jmonth = models.PositiveSmallIntegerField()
+    jday = models.PositiveSmallIntegerField()
+    week_start = models.DateField(db_index=True)
+    month_start = models.DateField(db_index=True)
+
+    def __str__(self):
+        return f'{self.jyear}/{self.jmonth}/{self.jday}'
+
+    def __repr__(self):
+        return str(self)
+
+    @classmethod
+    def fill(cls, start: date, end: date):
+        days = (end - start).days + 1
+        if days <= 0 or cls.objects.filter(date__gte=start, date__lte=end).count() == days:
+            return
+
+        ords = np.arange(start.toordinal(), end.toordinal() + 1)
+        jyears, jmonths, jdays = jcalendar.to_jalali(ords)
+        columns = zip(ords.tolist(), jyears.tolist(), jmonths.tolist(), jdays.tolist(),
+                      jcalendar.week_start(ords).tolist(), jcalendar.month_start(ords).tolist())
+        cls.objects.bulk_create([
+            cls(date=date.fromordinal(o), jyear=y, jmonth=m, jday=d,
+                week_start=date.fromordinal(w), month_start=date.fromordinal(ms))
+            for o, y, m, d, w, ms in columns
+        ], ignore_conflicts=True, batch_size=1000)
+
+
+class EntryQuerySet(QuerySet):
+    @transaction.atomic
+    def delete(self):
+        """Deletes the entries and takes all of them out of the running totals and rollups at once."""
+        rows = list(self.values_list('task_id', 'date', 'duration'))
+        result = super().delete()
+        _entries_deleted(rows)
+        return result
 
 
 class Entry(models.Model):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='entries')
+    day = models.ForeignObject(CalendarDay, on_delete=models.DO_NOTHING, from_fields=['date'], to_fields=['date'],
+                               related_name='entries')
     duration = models.DurationField(null=True)
     date = models.DateField()
     progress = models.DecimalField(max_digits=3, decimal_places=0, default=None, null=True, blank=True,
@@ -44,6 +319,14 @@ class Entry(models.Model):
 
     class Meta:
         unique_together = ('task', 'date')
+        indexes = [
+            models.Index(fields=['date'], name='entry_date_idx'),
+            # the entries eval_all_progress picks up; only the few of the latest run at a time
+            models.Index(fields=['task'], name='entry_pending_progress_idx',
+                         condition=Q(progress__isnull=True, duration__isnull=False)),
+        ]
+
+    objects = EntryQuerySet.as_manager()
 
     def __str__(self):
         progress = f' {self.progress}%' if self.progress is not None else str()
@@ -53,6 +336,43 @@ class Entry(models.Model):
     def __repr__(self):
         return str(self)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {'task_id', 'date', 'duration'}.issubset(field_names):
+            instance._loaded = (instance.task_id, instance.date, instance.duration)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        tracked = update_fields is None or {'task', 'task_id', 'date', 'duration'} & set(update_fields)
+        loaded = getattr(self, '_loaded', None)
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not tracked:
+            return
+
+        current = (self.task_id, self.date, self.duration)
+        if adding or loaded is not None:
+            if loaded == current:
+                return
+            deltas = [(self.task_id, self.date, self.duration or timedelta(seconds=0), 1)]
+            if loaded is not None:
+                deltas.append((loaded[0], loaded[1], -(loaded[2] or timedelta(seconds=0)), -1))
+            Task.apply_deltas(deltas)
+        else:  # the previous state of the row is unknown
+            Task.rebuild_totals([self.task_id])
+        touched = [current] if loaded is None else [current, loaded]
+        _refresh_rollups({task_id for task_id, _, _ in touched}, {dt for _, dt, _ in touched})
+        self._loaded = current
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded', (self.task_id, self.date, self.duration))
+        result = super().delete(*args, **kwargs)
+        _entries_deleted([loaded])
+        return result
+
     def eval_progress(self):
         if self.duration is None:
             return
@@ -61,22 +381,94 @@ class Entry(models.Model):
         self.save()
 
     @classmethod
-    def eval_all_progress(cls):
-        for entry in cls.objects.filter(progress__isnull=True, duration__isnull=False):
-            entry.eval_progress()
+    def trailing(cls, window: int, query: QuerySet = None) -> QuerySet:
+        """
+        The entries of query annotated with `trailing_sum` and `trailing_count` of the entries
+        of the same task in the `window` days through their date. The filters of query bound
+        the frames as well.
+        """
+        over = dict(partition_by=[F('task_id')], order_by=DayNumber('date').asc(),
+                    frame=DayRange(start=-(window - 1), end=0))
+        return (cls.objects.all() if query is None else query). \
+            annotate(trailing_sum=Window(Sum('duration'), **over), trailing_count=Window(Count('id'), **over))
+
+    @classmethod
+    def eval_all_progress(cls, task_ids: list[int] = None, window: int = None):
+        """
+        Bulk counterpart of `eval_progress`. The history of every task with pending entries
+        is scanned once, ordered by date, keeping a running sum and count so that each entry's
+        average-to-date is available without a query of its own. With a window, or
+        settings.PROGRESS_WINDOW, the average is the one of the trailing window instead.
+        """
+        pending = cls.objects.filter(progress__isnull=True, duration__isnull=False)
+        if task_ids is not None:
+            pending = pending.filter(task_id__in=task_ids)
+        pending_ids = set(pending.values_list('id', flat=True))
+        if not pending_ids:
+            return
+        window = window or settings.PROGRESS_WINDOW
+        if window:
+            cls._eval_trailing_progress(pending, pending_ids, window)
+            return
+
+        history = cls.objects.filter(task_id__in=pending.values('task_id')).order_by('task_id', 'date'). \
+            values_list('id', 'task_id', 'duration')
+        to_update_entries = list()
+        current_task, duration_sum, count = None, timedelta(seconds=0), 0
+        for pk, task_id, duration in history.iterator(chunk_size=5000):
+            if task_id != current_task:
+                current_task, duration_sum, count = task_id, timedelta(seconds=0), 0
+            count += 1
+            if duration is not None:
+                duration_sum += duration
+            if pk in pending_ids and duration_sum:
+                avg: timedelta = duration_sum / count
+                to_update_entries.append(cls(id=pk, progress=round(duration / avg * 100.0, 2)))
+
+        cls.objects.bulk_update(to_update_entries, ['progress'], batch_size=1000)
+
+    @classmethod
+    def _eval_trailing_progress(cls, pending: QuerySet, pending_ids: set[int], window: int):
+        first = pending.aggregate(first=Min('date'))['first']
+        history = cls.objects.filter(task_id__in=pending.values('task_id'), date__gte=first - timedelta(days=window - 1))
+        rows = cls.trailing(window, history).values_list('id', 'duration', 'trailing_sum', 'trailing_count')
+        to_update_entries = [cls(id=pk, progress=round(duration / (duration_sum / count) * 100.0, 2))
+                             for pk, duration, duration_sum, count in rows if pk in pending_ids and duration_sum]
+        cls.objects.bulk_update(to_update_entries, ['progress'], batch_size=1000)
 
     @classmethod
-    def eval_average_spent_time(cls, period: str, alternatives: bool = False) -> timedelta:
+    def trailing_spent_time(cls, windows: Iterable[int], sheet: Sheet = None,
+                            as_of: date = None) -> dict[str, dict[int, timedelta]]:
+        """
+        The daily spent time of each group over the trailing `windows`, in days through as_of
+        (today by default), by group and window: the total over the days with time spent, as
+        the daily figure of `eval_average_spent_time`. One grouped query for every window.
+        """
+        as_of, windows = as_of or timezone.localdate(), list(windows)
+        query = cls.objects.filter(duration__isnull=False, date__gt=as_of - timedelta(days=max(windows)),
+                                   date__lte=as_of)
+        if sheet is not None:
+            query = query.filter(task__sheet=sheet)
+        aggregates = dict()
+        for window in windows:
+            in_window = Q(date__gt=as_of - timedelta(days=window))
+            aggregates[f'total_{window}'] = Sum('duration', filter=in_window)
+            aggregates[f'days_{window}'] = Count('date', filter=in_window, distinct=True)
+        return {
+            kw['task__group']: {window: kw[f'total_{window}'] / kw[f'days_{window}']
+                                for window in windows if kw[f'days_{window}']}
+            for kw in query.values('task__group').order_by().annotate(**aggregates)
+        }
+
+    @classmethod
+    def eval_average_spent_time(cls, period: str, alternatives: bool = False, sheet: Sheet = None) -> timedelta:
+        """The average of a sheet's entries, or of every sheet's for None."""
         assert period in ['daily', 'weekly', 'monthly']
 
-        main_queryset = cls.objects.all()
-        main_queryset = main_queryset.filter(task__group='productive') if not alternatives else \
-            main_queryset.filter(task__group='alternative')
-        main_queryset = main_queryset.filter(duration__isnull=False)
-        first_date = main_queryset.order_by('date').first().date
-        first_date = jdatetime.date.fromgregorian(date=first_date)
-        last_date = main_queryset.order_by('date').last().date
-        last_date = jdatetime.date.fromgregorian(date=last_date)
+        group = 'alternative' if alternatives else 'productive'
+        main_queryset = cls.objects.filter(task__group=group, duration__isnull=False)
+        if sheet is not None:
+            main_queryset = main_queryset.filter(task__sheet=sheet)
 
         match period:
             case 'daily':
@@ -86,76 +478,86 @@ class Entry(models.Model):
                 return duration_sum / count
 
             case 'weekly':
-                query = main_queryset.values('date').annotate(c=Count('date')).order_by(). \
-                    annotate(duration=Sum('duration'))
-                query = {format_date(jdatify(kw['date'])): kw for kw in query}
-
-                last_date = last_week_day(calendar.FRIDAY, from_date=last_date)
+                bounds = main_queryset.aggregate(first=Min('date'), last=Max('date'))
+                first_date = bounds['first']
+                last_date = last_week_day(calendar.FRIDAY, from_date=bounds['last'])
                 if last_date < first_date or (last_date - first_date).days < 7:
-                    return cls.eval_average_spent_time('daily', alternatives) * 7
-
-                count = 0
-                duration_sum = timedelta(seconds=0)
-                date_iter = next_week_day(calendar.SATURDAY, from_date=first_date)
-                while date_iter <= last_date:
-                    end_of_week = next_week_day(calendar.FRIDAY, from_date=date_iter)
-                    count += 1
-
-                    date_range: list[date] = list()
-                    dt_iter = date_iter
-                    while dt_iter <= end_of_week:
-                        date_range.append(dt_iter)
-                        dt_iter += timedelta(days=1)
-
-                    duration_sum += timedelta(
-                        seconds=sum(
-                            [query[format_date(dt)]['duration'].total_seconds()
-                             for dt in date_range if format_date(dt) in query]
-                        )
-                    )
-
-                    date_iter += timedelta(days=7)
+                    return cls.eval_average_spent_time('daily', alternatives, sheet) * 7
 
-                return duration_sum / count
+                first_date = next_week_day(calendar.SATURDAY, from_date=first_date)
+                return cls._bucket_average('week_start', group, first_date, last_date, sheet)
 
             case 'monthly':
-                query = main_queryset.values('date').annotate(c=Count('date')).order_by(). \
-                    annotate(duration=Sum('duration'))
-                query = {format_date(jdatify(kw['date'])): kw for kw in query}
+                bounds = main_queryset.aggregate(first=Min('date'), last=Max('date'))
+                first_date, last_date = jdatify(bounds['first']), jdatify(bounds['last'])
 
                 first_date = last_day_of_month(first_date) + timedelta(days=1) \
                     if first_date.day > 15 else first_date.replace(day=1)
                 last_date = last_date.replace(day=1) - timedelta(days=1)
 
-                if first_date.month >= last_date.month:
-                    return cls.eval_average_spent_time('daily', alternatives) * 30
-
-                count = 0
-                duration_sum = timedelta(seconds=0)
-                date_iter = first_date
-                while date_iter <= last_date:
-                    end_of_month = last_day_of_month(date_iter)
-                    count += 1
-
-                    date_range: list[date] = list()
-                    dt_iter = date_iter
-                    while dt_iter <= end_of_month:
-                        date_range.append(dt_iter)
-                        dt_iter += timedelta(days=1)
-
-                    duration_sum += timedelta(
-                        seconds=sum(
-                            [query[format_date(dt)]['duration'].total_seconds()
-                             for dt in date_range if format_date(dt) in query]
-                        )
-                    )
-                    # duration_sum += main_queryset. \
-                    #     filter(date__gte=date_iter.togregorian(), date__lte=end_of_month.togregorian()). \
-                    #     aggregate(sum=Sum('duration'))['sum'] or timedelta(seconds=0)
-
-                    date_iter = last_day_of_month(date_iter) + timedelta(days=1)
+                if (first_date.year, first_date.month) >= (last_date.year, last_date.month):
+                    return cls.eval_average_spent_time('daily', alternatives, sheet) * 30
 
-                return duration_sum / count
+                return cls._bucket_average('month_start', group, first_date.togregorian(), last_date.togregorian(),
+                                           sheet)
+
+    @classmethod
+    def _bucket_average(cls, bucket: str, group: str, first_date: date, last_date: date,
+                        sheet: Sheet = None) -> timedelta:
+        """
+        Average of the total duration of `group` per bucket (`week_start` or `month_start` of
+        `CalendarDay`) over the buckets between first_date and last_date, both inclusive.
+        """
+        CalendarDay.fill(first_date, last_date)
+        in_group = Q(entries__task__group=group)
+        if sheet is not None:
+            in_group &= Q(entries__task__sheet=sheet)
+        buckets = CalendarDay.objects.filter(date__gte=first_date, date__lte=last_date). \
+            values(bucket).order_by(). \
+            annotate(duration=Sum('entries__duration', filter=in_group))
+
+        count = 0
+        duration_sum = timedelta(seconds=0)
+        for kw in buckets:
+            count += 1
+            duration_sum += kw['duration'] or timedelta(seconds=0)
+        return duration_sum / count
+
+
+def _refresh_rollups(task_ids: set[int], dates: set[date]):
+    """
+    Brings the rollups, which the average cells of the sheet and the stats API read, and the
+    revision of the sheets up to date with entries saved or deleted outside the ingestion.
+    """
+    from sheets import rollup  # rollup imports the models
+    sheets = list(Sheet.objects.filter(tasks__id__in=task_ids).distinct())
+    for sheet in sheets:  # rollups which were never built are built whole, not from this one entry
+        rollup.ensure(sheet)
+    rollup.update(task_ids, dates)
+    Sheet.touch([sheet.pk for sheet in sheets])
+
+
+def _entries_deleted(rows: list[tuple[int, date, timedelta]]):
+    """
+    Takes the (task_id, date, duration) of deleted entries out of the running totals and the
+    rollups, in one grouped delta and one refresh. Entries deleted along with their task or
+    sheet do not come through here; the task's handler below recomputes its group's buckets.
+    """
+    if not rows:
+        return
+    Task.apply_deltas([(task_id, dt, -(duration or timedelta(seconds=0)), -1) for task_id, dt, duration in rows])
+    _refresh_rollups({task_id for task_id, _, _ in rows}, {dt for _, dt, _ in rows})
+
+
+def _task_deleted(sender, instance: Task, origin=None, **kwargs):
+    if isinstance(origin, Sheet):  # the rollups of a deleted sheet go with it
+        return
+    from sheets import rollup
+    rollup.rebuild_groups(instance.sheet, [instance.group])
+    Sheet.touch([instance.sheet_id])
+
+
+post_delete.connect(_task_deleted, sender=Task)
 
 
 class AvgStat(models.Model):
@@ -170,6 +572,9 @@ class AvgStat(models.Model):
         ]
     )
 
+    class Meta:
+        unique_together = ('task', 'tipe')
+
     def __str__(self):
         return f'{self.task}:{self.tipe} {self.avg}'
 
@@ -178,39 +583,53 @@ class AvgStat(models.Model):
 
 
 class WeeklyStat(models.Model):
+    """Rollup of the entries of a task group of a sheet in the week starting on start_date (a saturday)."""
+    sheet = models.ForeignKey(Sheet, on_delete=models.CASCADE)
+    group = models.CharField(max_length=20)
     start_date = models.DateField()
+    total = models.DurationField()
+    days = models.PositiveSmallIntegerField()
     avg = models.DurationField()
 
+    class Meta:
+        unique_together = ('sheet', 'group', 'start_date')
+
     def week_string(self) -> str:
-        end = next_week_day(calendar.FRIDAY, from_date=self.end_date)
-        return format_week(self.start_date, end)
+        end = self.start_date + timedelta(days=6)
+        return format_week(jdatify(self.start_date), jdatify(end))
 
     def __str__(self):
-        return f'{self.week_string()} :: {stringify_timedelta(self.avg)}'
+        return f'{self.group}:{self.week_string()} :: {stringify_timedelta(self.avg)}'
 
     def __repr__(self):
         return str(self)
 
     def save(self, *a, **kw):
-        if self.start_date.weekday() != calendar.SATURDAY:
-            self.end_date = last_week_day(calendar.SATURDAY, from_date=self.start_date)
+        self.start_date = last_week_day(calendar.SATURDAY, exclusive=False, from_date=self.start_date)
         super().save(*a, **kw)
 
 
 class MonthlyStat(models.Model):
+    """Rollup of the entries of a task group of a sheet in the jalali month starting on start_date."""
+    sheet = models.ForeignKey(Sheet, on_delete=models.CASCADE)
+    group = models.CharField(max_length=20)
     start_date = models.DateField()
+    total = models.DurationField()
+    days = models.PositiveSmallIntegerField()
     avg = models.DurationField()
 
+    class Meta:
+        unique_together = ('sheet', 'group', 'start_date')
+
     def month_string(self) -> str:
-        return format_month(self.start_date)
+        return format_month(jdatify(self.start_date))
 
     def __str__(self):
-        return f'{self.month_string()} :: {stringify_timedelta(self.avg)}'
+        return f'{self.group}:{self.month_string()} :: {stringify_timedelta(self.avg)}'
 
     def __repr__(self):
         return str(self)
 
     def save(self, *a, **kw):
-        if self.start_date.day != 1:
-            self.start_date -= timedelta(days=self.start_date.day - 1)
+        self.start_date = date.fromordinal(int(jcalendar.month_start([self.start_date.toordinal()])[0]))
         super().save(*a, **kw)
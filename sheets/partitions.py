@@ -0,0 +1,165 @@
+"""
+Optional range partitioning of the entries table on PostgreSQL, by jalali year or quarter
+(`settings.ENTRY_PARTITIONING`). `convert` rebuilds the table as partitioned, `ensure` and
+`create_ahead` add the partitions for new dates, and `detach` takes old partitions out of
+the table for archiving. Everything here is a no-op on other databases or while the table is
+not partitioned.
+
+Queries bounded by `date`, such as those of the incremental rollups and of `Task.average`,
+are pruned to the partitions of their dates.
+"""
+import re
+
+from datetime import date
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from sheets.models import Entry
+from utils import jcalendar
+
+PERIODS = {'year': 12, 'quarter': 3}  # jalali months per partition
+BOUND_PATTERN = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+def table() -> str:
+    return Entry._meta.db_table
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT EXISTS(SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)',
+                       [table()])
+        return cursor.fetchone()[0]
+
+
+def bounds(dt: date, period: str) -> tuple[str, date, date]:
+    """Name, first day and the day after the last day of the partition holding dt."""
+    months = PERIODS[period]
+    idx = int(jcalendar.month_index(dt.toordinal()))
+    idx -= idx % months
+    starts = jcalendar.month_starts()
+    year = jcalendar.FIRST_YEAR + idx // 12
+    name = f'{table()}_{year}' if period == 'year' else f'{table()}_{year}q{idx % 12 // 3 + 1}'
+    return name, date.fromordinal(int(starts[idx])), date.fromordinal(int(starts[idx + months]))
+
+
+def partitions() -> dict[str, tuple[date, date]]:
+    """The partitions attached to the entries table and their bounds."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+                       'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass', [table()])
+        rows = cursor.fetchall()
+    result = dict()
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if match:
+            result[name] = (date.fromisoformat(match[1]), date.fromisoformat(match[2]))
+    return result
+
+
+def _create(cursor, first: date, last: date, period: str, existing: dict[str, tuple[date, date]]) -> list[str]:
+    created = list()
+    dt = first
+    while dt <= last:
+        name, start, end = bounds(dt, period)
+        if name not in existing:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table()}" '
+                           f'FOR VALUES FROM (%s) TO (%s)', [start, end])
+            created.append(name)
+        dt = end
+    return created
+
+
+def ensure(first: date, last: date) -> list[str]:
+    """Creates the missing partitions for the dates from first through last."""
+    period = settings.ENTRY_PARTITIONING
+    if not period or not is_partitioned():
+        return list()
+    with connection.cursor() as cursor:
+        return _create(cursor, first, last, period, partitions())
+
+
+def _ahead(period: str, count: int) -> date:
+    """A day in the `count`th partition after today's."""
+    last = timezone.localdate()
+    for _ in range(count):
+        last = bounds(last, period)[2]
+    return last
+
+
+def create_ahead(count: int = None) -> list[str]:
+    """Creates the partition of today and of the `count` periods after it."""
+    period = settings.ENTRY_PARTITIONING
+    if not period:
+        return list()
+    return ensure(timezone.localdate(), _ahead(period, settings.ENTRY_PARTITIONS_AHEAD if count is None else count))
+
+
+def detach(before: date, concurrently: bool = True) -> list[str]:
+    """
+    Detaches the partitions which end on or before `before`, leaving them as plain tables
+    to be dumped and dropped. `CONCURRENTLY` (PostgreSQL 14+) keeps the live table writable
+    meanwhile but cannot run inside a transaction.
+
+    The running totals, checkpoints and rollups still count the detached entries; rebuilding
+    them afterwards drops those entries from the figures.
+    """
+    if not is_partitioned():
+        return list()
+    detached = list()
+    with connection.cursor() as cursor:
+        for name, (_, end) in sorted(partitions().items(), key=lambda kv: kv[1]):
+            if end <= before:
+                option = ' CONCURRENTLY' if concurrently else ''
+                cursor.execute(f'ALTER TABLE "{table()}" DETACH PARTITION "{name}"{option}')
+                detached.append(name)
+    return detached
+
+
+@transaction.atomic
+def convert(period: str = None):
+    """
+    Rebuilds the entries table, as partitioned by `period`, or as a plain table for None.
+    The rows are copied under an exclusive lock, so this is meant for a migration or a
+    maintenance window. Partitioned, the primary key becomes (id, date), since PostgreSQL
+    requires the partition key in every unique constraint; (task, date) already has it.
+    """
+    assert period is None or period in PERIODS
+    if connection.vendor != 'postgresql' or is_partitioned() == bool(period):
+        return
+
+    name, old = table(), f'{table()}_old'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT count(*) FROM pg_constraint WHERE confrelid = %s::regclass', [name])
+        if cursor.fetchone()[0]:
+            raise ValueError(f'foreign keys reference `{name}`; they must be dropped before it is rebuilt.')
+        cursor.execute("SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f', 'c')", [name])
+        constraints = cursor.fetchall()
+        cursor.execute('SELECT i.relname, pg_get_indexdef(x.indexrelid) FROM pg_index x '
+                       'JOIN pg_class i ON i.oid = x.indexrelid WHERE x.indrelid = %s::regclass '
+                       'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)', [name])
+        indexes = cursor.fetchall()
+        cursor.execute(f'SELECT min(date), max(date), coalesce(max(id), 0) FROM "{name}"')
+        first, last, max_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE "{name}" RENAME TO "{old}"')
+        # defaults are left behind: the id sequence belongs to the old table
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{old}")' + (' PARTITION BY RANGE (date)' if period else ''))
+        if period:
+            today = timezone.localdate()
+            _create(cursor, min(first or today, today),
+                    max(last or today, _ahead(period, settings.ENTRY_PARTITIONS_AHEAD)), period, dict())
+        cursor.execute(f'INSERT INTO "{name}" SELECT * FROM "{old}"')
+        cursor.execute(f'DROP TABLE "{old}"')
+
+        cursor.execute(f'CREATE SEQUENCE "{name}_id_seq" START WITH {max_id + 1} OWNED BY "{name}".id')
+        cursor.execute(f'ALTER TABLE "{name}" ALTER COLUMN id SET DEFAULT nextval(\'"{name}_id_seq"\')')
+        for constraint, kind, definition in constraints:
+            if kind == 'p':
+                definition = 'PRIMARY KEY (id, date)' if period else 'PRIMARY KEY (id)'
+            cursor.execute(f'ALTER TABLE "{name}" ADD CONSTRAINT "{constraint}" {definition}')
+        for _, definition in indexes:
+            cursor.execute(definition)
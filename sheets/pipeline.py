@@ -0,0 +1,87 @@
+"""
+Runs the stages of a nightly run as a dependency graph. Stages whose dependencies are done
+run together on a thread pool, so that network bound stages overlap with database bound ones.
+"""
+import time
+
+from django.db import connections
+from contextlib import nullcontext
+from typing import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, Future
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable, deps: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+    def __repr__(self):
+        return f'{self.name} <- {", ".join(self.deps)}' if self.deps else self.name
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage], recorder=None):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            unknown = set(stage.deps) - self.stages.keys()
+            if unknown:
+                raise ValueError(f'stage `{stage.name}` depends on unknown stages {sorted(unknown)}.')
+        self.timings: dict[str, float] = dict()
+        self.wall_time = 0.0
+        self.recorder = recorder  # a sheets.metrics.Recorder, to count the queries and API calls of each stage
+
+    def _run_stage(self, stage: Stage, close_connections: bool):
+        start = time.perf_counter()
+        try:
+            with self.recorder.stage(stage.name) if self.recorder else nullcontext():
+                stage.func()
+        finally:
+            self.timings[stage.name] = time.perf_counter() - start
+            if close_connections:  # each worker thread has database connections of its own
+                connections.close_all()
+
+    def run(self, concurrent: bool = True, max_workers: int = 4):
+        """Runs every stage after its dependencies. The first failing stage's error is raised."""
+        self.timings.clear()
+        start = time.perf_counter()
+        if not concurrent:
+            for name in self.order():
+                self._run_stage(self.stages[name], close_connections=False)
+        else:
+            self._run_concurrently(max_workers)
+        self.wall_time = time.perf_counter() - start
+
+    def _run_concurrently(self, max_workers: int):
+        done: set[str] = set()
+        running: dict[Future, str] = dict()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while len(done) < len(self.stages):
+                for name, stage in self.stages.items():
+                    if name not in done and name not in running.values() and set(stage.deps) <= done:
+                        running[executor.submit(self._run_stage, stage, True)] = name
+                if not running:
+                    raise ValueError('the stages have a dependency cycle.')
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                    done.add(running.pop(future))
+
+    def order(self) -> list[str]:
+        """The stages in a dependency respecting order."""
+        order, done = list(), set()
+        while len(order) < len(self.stages):
+            ready = [name for name, stage in self.stages.items() if name not in done and set(stage.deps) <= done]
+            if not ready:
+                raise ValueError('the stages have a dependency cycle.')
+            order.extend(ready)
+            done.update(ready)
+        return order
+
+    def report(self) -> str:
+        sequential = sum(self.timings.values())
+        lines = [f'{name}: {self.timings[name]:.3f}s' for name in self.order() if name in self.timings]
+        lines.append(f'stages total {sequential:.3f}s, wall time {self.wall_time:.3f}s, '
+                     f'saved {sequential - self.wall_time:.3f}s')
+        return '\n'.join(lines)
@@ -0,0 +1,239 @@
+"""
+Incremental rollups of the entries into AvgStat, WeeklyStat and MonthlyStat.
+
+`update` recomputes only the rows of the tasks, weeks and months touched by a batch of
+entries, `regroup` the buckets of the groups tasks moved between, `rebuild` recomputes
+every row from scratch and `check` compares the stored rows with a from-scratch recompute.
+Reports such as `average_spent_time` read these tables instead of aggregating the whole
+entry history.
+"""
+import numpy as np
+
+from datetime import date, timedelta
+from typing import Iterable
+from django.db import transaction
+from django.db.models import Sum, Count, Min, Max, Model, QuerySet
+from sheets.models import Sheet, Task, Entry, CalendarDay, AvgStat, WeeklyStat, MonthlyStat
+from utils import jcalendar
+
+BUCKETS = {WeeklyStat: 'week_start', MonthlyStat: 'month_start'}
+BUCKET_KEYS = ('sheet_id', 'group', 'start_date')
+BUCKET_FIELDS = ['total', 'days', 'avg']
+
+
+def _bucket_rows(model: type[Model], sheet_ids: Iterable[int] = None, groups: Iterable[str] = None,
+                 starts: Iterable[date] = None) -> dict[tuple, dict]:
+    bucket = BUCKETS[model]
+    query = Entry.objects.filter(duration__isnull=False)
+    if sheet_ids is not None:
+        query = query.filter(task__sheet_id__in=sheet_ids)
+    if groups is not None:
+        query = query.filter(task__group__in=groups)
+    if starts is not None:
+        # the date bounds let a partitioned entries table skip the partitions out of the buckets
+        ords = [start.toordinal() for start in starts]
+        end = jcalendar.week_end(max(ords)) if model is WeeklyStat else jcalendar.month_end(max(ords))
+        query = query.filter(**{f'day__{bucket}__in': starts},
+                             date__gte=min(starts), date__lte=date.fromordinal(int(end)))
+    query = query.values('task__sheet_id', 'task__group', f'day__{bucket}').order_by(). \
+        annotate(total=Sum('duration'), days=Count('date', distinct=True))
+    return {
+        (kw['task__sheet_id'], kw['task__group'], kw[f'day__{bucket}']):
+            {'total': kw['total'], 'days': kw['days'], 'avg': kw['total'] / kw['days']}
+        for kw in query
+    }
+
+
+def _avg_rows(task_ids: Iterable[int] = None) -> dict[tuple, dict]:
+    query = Entry.objects.all() if task_ids is None else Entry.objects.filter(task_id__in=task_ids)
+    query = list(query.values('task_id').order_by().
+                 annotate(total=Sum('duration'), count=Count('id'), first=Min('date'), last=Max('date')))
+    if not query:
+        return dict()
+
+    firsts = np.array([kw['first'].toordinal() for kw in query])
+    lasts = np.array([kw['last'].toordinal() for kw in query])
+    weeks = (jcalendar.week_start(lasts) - jcalendar.week_start(firsts)) // 7 + 1
+    months = jcalendar.month_index(lasts) - jcalendar.month_index(firsts) + 1
+    years = jcalendar.to_jalali(lasts)[0] - jcalendar.to_jalali(firsts)[0] + 1
+
+    rows = dict()
+    for kw, w, m, y in zip(query, weeks.tolist(), months.tolist(), years.tolist()):
+        total = kw['total'] or timedelta(seconds=0)
+        for tipe, count in (('*', kw['count']), ('w', w), ('m', m), ('y', y)):
+            rows[(kw['task_id'], tipe)] = {'avg': total / count}
+    return rows
+
+
+def refresh_averages(task_ids: Iterable[int] = None):
+    """
+    Writes the `AvgStat` rows of every tipe for the tasks, or for every task, out of the one
+    grouped query of `_avg_rows`, in a bulk upsert, and drops the rows of tasks left without entries.
+    """
+    rows = _avg_rows(task_ids)
+    stale = AvgStat.objects.all() if task_ids is None else AvgStat.objects.filter(task_id__in=task_ids)
+    stale.exclude(task_id__in={task_id for task_id, _ in rows}).delete()
+    AvgStat.objects.bulk_create([AvgStat(task_id=task_id, tipe=tipe, avg=values['avg'])
+                                 for (task_id, tipe), values in rows.items()],
+                                batch_size=1000, update_conflicts=True, unique_fields=['task', 'tipe'],
+                                update_fields=['avg'])
+
+
+def _sync(scope: QuerySet, keys: tuple[str, ...], rows: dict[tuple, dict], fields: list[str]):
+    """Makes the rows in scope equal `rows`: updates the existing ones, creates the missing ones
+    and deletes the ones which no longer have entries."""
+    existing = {tuple(getattr(obj, k) for k in keys): obj for obj in scope}
+    to_update, to_create = list(), list()
+    for key, values in rows.items():
+        obj = existing.pop(key, None)
+        if obj is None:
+            to_create.append(scope.model(**dict(zip(keys, key)), **values))
+        elif any(getattr(obj, f) != v for f, v in values.items()):
+            for f, v in values.items():
+                setattr(obj, f, v)
+            to_update.append(obj)
+
+    scope.model.objects.filter(pk__in=[obj.pk for obj in existing.values()]).delete()
+    scope.model.objects.bulk_update(to_update, fields, batch_size=1000)
+    scope.model.objects.bulk_create(to_create, batch_size=1000)
+
+
+def _fill_calendar(dates: Iterable[date]):
+    ords = np.array([dt.toordinal() for dt in dates])
+    if ords.size:
+        start = min(jcalendar.week_start(ords).min(), jcalendar.month_start(ords).min())
+        end = max(jcalendar.week_end(ords).max(), jcalendar.month_end(ords).max())
+        CalendarDay.fill(date.fromordinal(int(start)), date.fromordinal(int(end)))
+
+
+@transaction.atomic
+def update(task_ids: Iterable[int], dates: Iterable[date]):
+    """Recomputes the rollup rows affected by entries of `task_ids` on `dates`."""
+    task_ids, dates = set(task_ids), set(dates)
+    if not task_ids or not dates:
+        return
+    _fill_calendar(dates)
+    scopes = list(Task.objects.filter(id__in=task_ids).values_list('sheet_id', 'group').distinct())
+    sheet_ids, groups = {sheet_id for sheet_id, _ in scopes}, {group for _, group in scopes}
+    _sync_buckets(sheet_ids, groups, np.array([dt.toordinal() for dt in dates]))
+    refresh_averages(task_ids)
+
+
+def _sync_buckets(sheet_ids: set[int], groups: set[str], ords: np.ndarray):
+    for model, starts in ((WeeklyStat, jcalendar.week_start(ords)), (MonthlyStat, jcalendar.month_start(ords))):
+        starts = [date.fromordinal(o) for o in set(starts.tolist())]
+        scope = model.objects.filter(sheet_id__in=sheet_ids, group__in=groups, start_date__in=starts)
+        _sync(scope, BUCKET_KEYS, _bucket_rows(model, sheet_ids, groups, starts), BUCKET_FIELDS)
+
+
+@transaction.atomic
+def regroup(sheet: Sheet, task_ids: Iterable[int], groups: Iterable[str]):
+    """
+    Recomputes the buckets of the groups of the sheet over the whole date range of the tasks,
+    after the tasks moved between these groups. Rollups which were never built are left to `ensure`.
+    """
+    task_ids, groups = set(task_ids), set(groups)
+    if not task_ids or not WeeklyStat.objects.filter(sheet=sheet).exists():
+        return
+    bounds = Entry.objects.filter(task_id__in=task_ids, duration__isnull=False). \
+        aggregate(first=Min('date'), last=Max('date'))
+    if bounds['first'] is None:
+        return
+    _fill_calendar([bounds['first'], bounds['last']])
+    _sync_buckets({sheet.pk}, groups, np.arange(bounds['first'].toordinal(), bounds['last'].toordinal() + 1))
+
+
+@transaction.atomic
+def rebuild(sheet: Sheet = None):
+    """
+    Recomputes the rollups of the sheet, or of every sheet for None, from scratch, and bumps
+    the revision of the rebuilt sheets so the stats API does not answer from before.
+    """
+    if sheet is None:
+        entries, sheet_ids, task_ids = Entry.objects.all(), None, None
+    else:
+        entries, sheet_ids = Entry.objects.filter(task__sheet=sheet), [sheet.pk]
+        task_ids = Task.objects.filter(sheet=sheet).values_list('id', flat=True)
+    bounds = entries.aggregate(first=Min('date'), last=Max('date'))
+    if bounds['first'] is not None:
+        _fill_calendar([bounds['first'], bounds['last']])
+    for model in BUCKETS:
+        scope = model.objects.all() if sheet is None else model.objects.filter(sheet=sheet)
+        _sync(scope, BUCKET_KEYS, _bucket_rows(model, sheet_ids), BUCKET_FIELDS)
+    refresh_averages(task_ids)
+    Sheet.touch(Sheet.objects.values('id') if sheet is None else sheet_ids)
+
+
+@transaction.atomic
+def rebuild_groups(sheet: Sheet, groups: Iterable[str]):
+    """Recomputes every bucket of the groups of the sheet, such as after a task of theirs was deleted."""
+    groups = set(groups)
+    if not WeeklyStat.objects.filter(sheet=sheet).exists():
+        return
+    for model in BUCKETS:
+        scope = model.objects.filter(sheet=sheet, group__in=groups)
+        _sync(scope, BUCKET_KEYS, _bucket_rows(model, [sheet.pk], groups), BUCKET_FIELDS)
+
+
+def ensure(sheet: Sheet = None):
+    """Builds the rollups from scratch if they have never been built, of the sheet only if one is given."""
+    weeks, entries = WeeklyStat.objects.all(), Entry.objects.filter(duration__isnull=False)
+    if sheet is not None:
+        weeks, entries = weeks.filter(sheet=sheet), entries.filter(task__sheet=sheet)
+    if not weeks.exists() and entries.exists():
+        rebuild(sheet)
+
+
+def check() -> list[str]:
+    """Differences between the stored rollups and a from-scratch recompute."""
+    bounds = Entry.objects.aggregate(first=Min('date'), last=Max('date'))
+    if bounds['first'] is not None:
+        _fill_calendar([bounds['first'], bounds['last']])
+
+    mismatches = list()
+    tables = [(model, BUCKET_KEYS, _bucket_rows(model), BUCKET_FIELDS) for model in BUCKETS]
+    tables.append((AvgStat, ('task_id', 'tipe'), _avg_rows(), ['avg']))
+    for model, keys, expected, fields in tables:
+        stored = {tuple(getattr(obj, k) for k in keys): {f: getattr(obj, f) for f in fields}
+                  for obj in model.objects.all()}
+        for key in expected.keys() | stored.keys():
+            if expected.get(key) != stored.get(key):
+                mismatches.append(f'{model.__name__}{key}: stored {stored.get(key)}, expected {expected.get(key)}')
+    return mismatches
+
+
+def average_spent_time(period: str, group: str, sheet: Sheet) -> timedelta:
+    """Same figures as `Entry.eval_average_spent_time`, read from the rollup tables."""
+    assert period in ['daily', 'weekly', 'monthly']
+
+    weeks = WeeklyStat.objects.filter(sheet=sheet, group=group)
+    bounds = weeks.aggregate(first=Min('start_date'), last=Max('start_date'), total=Sum('total'), days=Sum('days'))
+    daily: timedelta = bounds['total'] / bounds['days']
+
+    match period:
+        case 'daily':
+            return daily
+
+        case 'weekly':
+            first, last = bounds['first'] + timedelta(days=7), bounds['last'] - timedelta(days=7)
+            if last < first:
+                return daily * 7
+            total = weeks.filter(start_date__gte=first, start_date__lte=last).aggregate(s=Sum('total'))['s']
+            return (total or timedelta(seconds=0)) / ((last - first).days // 7 + 1)
+
+        case 'monthly':
+            bounds = Entry.objects.filter(task__sheet=sheet, task__group=group, duration__isnull=False). \
+                aggregate(first=Min('date'), last=Max('date'))
+            first, last = bounds['first'].toordinal(), bounds['last'].toordinal()
+            first_idx = int(jcalendar.month_index(first)) + (1 if jcalendar.to_jalali(first)[2] > 15 else 0)
+            last_idx = int(jcalendar.month_index(last)) - 1
+            if first_idx >= last_idx:
+                return daily * 30
+
+            starts = jcalendar.month_starts()
+            total = MonthlyStat.objects.filter(
+                sheet=sheet, group=group, start_date__gte=date.fromordinal(int(starts[first_idx])),
+                start_date__lte=date.fromordinal(int(starts[last_idx]))
+            ).aggregate(s=Sum('total'))['s']
+            return (total or timedelta(seconds=0)) / (last_idx - first_idx + 1)
+
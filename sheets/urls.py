@@ -0,0 +1,10 @@
+from django.urls import path
+from sheets import views
+
+app_name = 'sheets'
+urlpatterns = [
+    path('sheets/', views.sheets, name='sheets'),
+    path('sheets/<int:sheet_id>/tasks/', views.task_averages, name='task-averages'),
+    path('sheets/<int:sheet_id>/groups/', views.group_averages, name='group-averages'),
+    path('sheets/<int:sheet_id>/entries/', views.entries, name='entries'),
+]
@@ -0,0 +1,172 @@
+"""
+Read-only JSON stats of a sheet, served to the ASGI entry point.
+
+Every response is cached under the revision of its sheet, which the ingestion bumps on each
+write, and today's date for the ones relative to it, so the cache never has to be purged and
+stays correct with a per-process cache too.
+The revision also makes the ETag: a conditional GET of unchanged data costs a single lookup
+of the sheet and no rendering.
+
+The endpoints need a logged in session and serve each user the sheets they own.
+"""
+import json
+import hashlib
+
+from datetime import date, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse
+from sheets import rollup
+from sheets.models import Sheet, Task, Entry, AvgStat, WeeklyStat
+from utils.datetime import jdatify
+
+PERIODS = ['daily', 'weekly', 'monthly']
+GROUPS = ['productive', 'alternative']
+PAGE_SIZE, MAX_PAGE_SIZE = 100, 1000
+
+
+class InvalidQuery(ValueError):
+    """A malformed query parameter, answered with a JSON 400."""
+
+
+def seconds(value: timedelta | None) -> float | None:
+    return None if value is None else value.total_seconds()
+
+
+def _user(request):
+    return request.user if request.user.is_authenticated else None
+
+
+async def authenticated_user(request):
+    """The logged in user of the request, or None. The session is read synchronously."""
+    return await sync_to_async(_user)(request)
+
+
+def unauthorized() -> JsonResponse:
+    return JsonResponse({'error': 'authentication required.'}, status=401)
+
+
+async def respond(request, sheet_id: int, build, dated: bool = False) -> HttpResponse:
+    """
+    Answers from the cache or with `build(sheet, request)`, honoring If-None-Match. An
+    `InvalidQuery` raised by build is answered with a JSON 400. The ETag, and so the cache
+    key, of a `dated` response, one relative to today such as the trailing windows, includes
+    today's date. Only the owner of the sheet, or a superuser, is served; other sheets are a 404.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    user = await authenticated_user(request)
+    if user is None:
+        return unauthorized()
+    try:
+        sheet = await Sheet.visible_to(user).aget(pk=sheet_id)
+    except Sheet.DoesNotExist:
+        raise Http404(f'sheet {sheet_id} does not exist.')
+
+    digest = hashlib.sha1(request.get_full_path().encode()).hexdigest()[:16]
+    version = f'{sheet.revision}.{timezone.localdate().isoformat()}' if dated else str(sheet.revision)
+    etag = f'"{sheet.pk}.{version}.{digest}"'
+    matches = [tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')]
+    if etag in matches or '*' in matches:
+        response = HttpResponseNotModified()
+    else:
+        key = f'sheets:stats:{etag}'
+        body = await cache.aget(key)
+        if body is None:
+            try:
+                body = json.dumps(await build(sheet, request), ensure_ascii=False)
+            except InvalidQuery as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            await cache.aset(key, body, settings.STATS_CACHE_TIMEOUT)
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'  # revalidate every time; unchanged data is a 304
+    return response
+
+
+async def sheets(request):
+    """The sheets of the logged in user."""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    user = await authenticated_user(request)
+    if user is None:
+        return unauthorized()
+    return JsonResponse({'sheets': [{'id': sheet.pk, 'name': sheet.name, 'active': sheet.active}
+                                    async for sheet in Sheet.visible_to(user).order_by('name')]})
+
+
+async def _task_averages(sheet: Sheet, request) -> dict:
+    tasks = {task.pk: {'name': task.name, 'group': task.group, 'genre': task.genre, 'row': task.row,
+                       'archived': task.archived, 'averages': dict()}
+             async for task in Task.objects.filter(sheet=sheet).order_by('row')}
+    async for stat in AvgStat.objects.filter(task__sheet=sheet):
+        tasks[stat.task_id]['averages'][stat.get_tipe_display()] = seconds(stat.avg)
+    trailing = await sync_to_async(Task.trailing_averages)(settings.AVERAGE_WINDOWS, Task.objects.filter(sheet=sheet))
+    for task_id, task in tasks.items():
+        task['trailing'] = {str(window): seconds(trailing.get(task_id, dict()).get(window))
+                            for window in settings.AVERAGE_WINDOWS}
+    return {'sheet': sheet.name, 'tasks': list(tasks.values())}
+
+
+async def task_averages(request, sheet_id: int):
+    """The overall, weekly, monthly and yearly average of each task, and its trailing ones, in seconds."""
+    return await respond(request, sheet_id, _task_averages, dated=True)
+
+
+def _group_averages(sheet: Sheet, request) -> dict:
+    averages = dict()
+    for group in GROUPS:
+        if not WeeklyStat.objects.filter(sheet=sheet, group=group).exists():
+            averages[group] = dict.fromkeys(PERIODS)
+            continue
+        averages[group] = {period: seconds(rollup.average_spent_time(period, group, sheet)) for period in PERIODS}
+    trailing = Entry.trailing_spent_time(settings.AVERAGE_WINDOWS, sheet)
+    for group in GROUPS:
+        averages[group]['trailing'] = {str(window): seconds(trailing.get(group, dict()).get(window))
+                                       for window in settings.AVERAGE_WINDOWS}
+    return {'sheet': sheet.name, 'groups': averages}
+
+
+async def group_averages(request, sheet_id: int):
+    """The daily, weekly, monthly and trailing daily averages of the productive and alternative groups."""
+    return await respond(request, sheet_id, sync_to_async(_group_averages), dated=True)
+
+
+def _cursor(value: str) -> tuple[date, int]:
+    dt, pk = value.split('_')
+    return date.fromisoformat(dt), int(pk)
+
+
+async def _entries(sheet: Sheet, request) -> dict:
+    try:
+        limit = max(1, min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+        after = _cursor(request.GET['after']) if request.GET.get('after') else None
+    except ValueError:
+        raise InvalidQuery('invalid `limit` or `after`.')
+
+    query = Entry.objects.filter(task__sheet=sheet).select_related('task').order_by('-date', '-id')
+    if request.GET.get('task'):
+        query = query.filter(task__name=request.GET['task'])
+    if after:  # keyset pagination: an index seek instead of an ever larger offset
+        query = query.filter(Q(date__lt=after[0]) | Q(date=after[0], id__lt=after[1]))
+
+    entries = [entry async for entry in query[:limit + 1]]
+    page = entries[:limit]
+    return {
+        'sheet': sheet.name,
+        'entries': [{'date': entry.date.isoformat(), 'jdate': jdatify(entry.date).strftime('%Y/%m/%d'),
+                     'task': entry.task.name, 'duration': seconds(entry.duration),
+                     'progress': None if entry.progress is None else float(entry.progress)} for entry in page],
+        'next': f'{page[-1].date.isoformat()}_{page[-1].pk}' if len(entries) > limit else None,
+    }
+
+
+async def entries(request, sheet_id: int):
+    """
+    The entries of the sheet, newest first, `limit` at a time. `next` is passed back as
+    `after` for the following page; `task` narrows them to a task by name.
+    """
+    return await respond(request, sheet_id, _entries)
@@ -3,6 +3,7 @@ import jdatetime
 from django.utils import timezone
 from datetime import timedelta, datetime, date
 from typing import Union
+from utils.string import DATE_FORMAT
 
 
 def _ensure_tz_aware(datetime_val):
@@ -55,9 +56,7 @@ def last_week_day(week_day, exclusive=True, from_date=None):
     """
     from_date = today() if from_date is None else from_date
     potential_day = from_date - timedelta(days=1 if exclusive else 0)
-    while potential_day.weekday() != week_day:
-        potential_day -= timedelta(days=1)
-    return potential_day
+    return potential_day - timedelta(days=(potential_day.weekday() - week_day) % 7)
 
 
 def next_week_day(week_day, exclusive=True, from_date=None):
@@ -75,9 +74,7 @@ def next_week_day(week_day, exclusive=True, from_date=None):
     """
     from_date = today() if from_date is None else from_date
     potential_day = from_date + timedelta(days=1 if exclusive else 0)
-    while potential_day.weekday() != week_day:
-        potential_day += timedelta(days=1)
-    return potential_day
+    return potential_day + timedelta(days=(week_day - potential_day.weekday()) % 7)
 
 
 def last_day_of_month(dt: date) -> date:
@@ -102,3 +99,10 @@ def rjdatify(dt: Union[date, datetime, jdatetime.date, jdatetime.datetime]):
         return dt
 
     return dt.togregorian()
+
+
+def date_from_str(value: str, jalali: bool = True) -> date:
+    """Parses a `utils.string.DATE_FORMAT` date, jalali by default, into a gregorian date."""
+    if jalali:
+        return jdatetime.datetime.strptime(value.strip(), DATE_FORMAT).date().togregorian()
+    return datetime.strptime(value.strip(), DATE_FORMAT).date()
@@ -0,0 +1,108 @@
+"""
+Jalali calendar kernel working on integer day ordinals (`date.toordinal()`) instead of
+date objects and formatted strings. Conversions go through a memoized table of the
+ordinals on which each jalali month starts, so they are a lookup per date and can be
+applied to whole numpy arrays at once.
+"""
+import calendar
+import jdatetime
+import numpy as np
+
+from functools import lru_cache
+from datetime import date, datetime
+from typing import Iterable, Union
+
+FIRST_YEAR = 1300  # 1921/03/21
+LAST_YEAR = 1499  # 2121/03/20
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()  # day 0 of numpy's datetime64[D]
+
+Ordinals = Union[np.ndarray, Iterable[int]]
+
+
+@lru_cache(maxsize=None)
+def month_starts() -> np.ndarray:
+    """
+    Ordinal of the first day of every jalali month from FIRST_YEAR through LAST_YEAR,
+    followed by the first day of LAST_YEAR + 1 so that month lengths are differences.
+    Index of a month is `(jyear - FIRST_YEAR) * 12 + jmonth - 1`.
+    """
+    starts = [jdatetime.date(year, month, 1).togregorian().toordinal()
+              for year in range(FIRST_YEAR, LAST_YEAR + 1) for month in range(1, 13)]
+    starts.append(jdatetime.date(LAST_YEAR + 1, 1, 1).togregorian().toordinal())
+    table = np.array(starts, dtype=np.int64)
+    table.flags.writeable = False
+    return table
+
+
+def ordinal(dt: Union[date, datetime, jdatetime.date, jdatetime.datetime]) -> int:
+    if isinstance(dt, (jdatetime.date, jdatetime.datetime)):
+        dt = dt.togregorian()
+    if isinstance(dt, datetime):
+        dt = dt.date()
+    return dt.toordinal()
+
+
+def ordinals(dates: Iterable) -> np.ndarray:
+    """Day ordinals of an iterable of dates, or of a numpy datetime64 array."""
+    if isinstance(dates, np.ndarray) and np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+    return np.fromiter((ordinal(dt) for dt in dates), dtype=np.int64)
+
+
+def to_datetime64(ords: Ordinals) -> np.ndarray:
+    return (np.asarray(ords, dtype=np.int64) - EPOCH_ORDINAL).astype('datetime64[D]')
+
+
+def month_index(ords: Ordinals) -> np.ndarray:
+    """Index of the jalali month of each ordinal into `month_starts()`."""
+    ords = np.asarray(ords, dtype=np.int64)
+    table = month_starts()
+    if ords.size and (ords.min() < table[0] or ords.max() >= table[-1]):
+        raise ValueError(f'dates should be within jalali years {FIRST_YEAR} and {LAST_YEAR}.')
+    return np.searchsorted(table, ords, side='right') - 1
+
+
+def to_jalali(ords: Ordinals) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Jalali (years, months, days) of an array of gregorian day ordinals."""
+    ords = np.asarray(ords, dtype=np.int64)
+    idx = month_index(ords)
+    years, months = np.divmod(idx, 12)
+    return years + FIRST_YEAR, months + 1, ords - month_starts()[idx] + 1
+
+
+def to_gregorian(years: Ordinals, months: Ordinals, days: Ordinals) -> np.ndarray:
+    """Gregorian day ordinals of arrays of jalali years, months and days."""
+    idx = (np.asarray(years, dtype=np.int64) - FIRST_YEAR) * 12 + np.asarray(months, dtype=np.int64) - 1
+    return month_starts()[idx] + np.asarray(days, dtype=np.int64) - 1
+
+
+def month_key(ords: Ordinals) -> np.ndarray:
+    """Integer key of the jalali month, `jyear * 12 + jmonth - 1`, usable in place of `format_month`."""
+    return month_index(ords) + FIRST_YEAR * 12
+
+
+def month_start(ords: Ordinals) -> np.ndarray:
+    return month_starts()[month_index(ords)]
+
+
+def month_end(ords: Ordinals) -> np.ndarray:
+    return month_starts()[month_index(ords) + 1] - 1
+
+
+def week_start(ords: Ordinals, first_day: int = calendar.SATURDAY) -> np.ndarray:
+    """
+    Ordinal of the day starting the week of each ordinal. `first_day` is a gregorian
+    weekday (Monday == 0 ... Saturday == 5 Sunday == 6); ordinal 1 is a Monday.
+    """
+    ords = np.asarray(ords, dtype=np.int64)
+    return ords - (ords - 1 - first_day) % 7
+
+
+def week_end(ords: Ordinals, first_day: int = calendar.SATURDAY) -> np.ndarray:
+    return week_start(ords, first_day) + 6
+
+
+def jdate(ord_: int) -> jdatetime.date:
+    """Scalar conversion of a gregorian day ordinal to a jalali date."""
+    years, months, days = to_jalali([ord_])
+    return jdatetime.date(int(years[0]), int(months[0]), int(days[0]))